@@ -0,0 +1,123 @@
+"""Compare prompt tokens per turn: fixed message windows vs the context builder.
+
+Replays a synthetic conversation (short questions, long and short assistant
+replies) against an in-memory message store, and for every turn counts the
+tokens of the history that would be sent with the old ``[-8:]`` window and
+with ``ContextBuilder`` under a token budget. Summaries are simulated, so no
+API calls are made.
+
+    python benchmarks/context_tokens.py --turns 60 --budget 1500
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import ContextBuilder, count_tokens, message_tokens, uses_tiktoken  # noqa: E402
+
+WORDS = (
+    "gin vodka rum tequila mezcal whiskey bourbon rye vermouth bitters citrus lime lemon "
+    "orange syrup sugar soda tonic ice shake stir strain garnish glass coupe rocks highball "
+    "smoky sweet sour bitter herbal floral spicy aged barrel cask proof bottle brand label"
+).split()
+
+
+class MemoryStore:
+    """Minimal stand-in for DatabaseManager's history and summary methods"""
+
+    def __init__(self):
+        self.messages = []
+        self.summaries = {}
+
+    def add(self, role, content):
+        self.messages.append({"id": len(self.messages) + 1, "role": role, "content": content})
+
+    def get_recent_messages(self, session_id, limit=50, after_id=None, include_ids=False):
+        if after_id is None:
+            rows = self.messages[-limit:] if limit else []
+        else:
+            rows = [m for m in self.messages if m["id"] > after_id][:limit]
+        if include_ids:
+            return [dict(m) for m in rows]
+        return [{"role": m["role"], "content": m["content"]} for m in rows]
+
+    def get_session_summary(self, session_id):
+        return self.summaries.get(session_id)
+
+    def save_session_summary(self, session_id, summary, last_message_id):
+        self.summaries[session_id] = {"summary": summary, "last_message_id": last_message_id}
+
+
+def fake_summarize(previous, messages, words=110):
+    # Stands in for the LLM: a bounded-length digest of the folded messages
+    text = " ".join([previous] + [m["content"] for m in messages]).split()
+    return " ".join(text[-words:])
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))) + "."
+
+
+def describe(samples):
+    samples = sorted(samples)
+    return {
+        "mean": round(statistics.mean(samples), 1),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "max": samples[-1],
+        "total": sum(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--window", type=int, default=8, help="message window of the old approach")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store = MemoryStore()
+    builder = ContextBuilder(store, fake_summarize, budget=args.budget)
+
+    before, after, kept_before, kept_after = [], [], [], []
+    for _ in range(args.turns):
+        question = sentence(rng, 5, 30)
+        current = {"role": "user", "content": question}
+
+        old_history = store.get_recent_messages("bench", args.window - 1) + [current]
+        before.append(sum(message_tokens(m) for m in old_history))
+        kept_before.append(len(old_history) - 1)
+
+        new_history = builder.history("bench") + [current]
+        after.append(sum(message_tokens(m) for m in new_history))
+        kept_after.append(len(new_history) - 1)
+
+        # Mix of short answers and long, list-heavy replies
+        reply = sentence(rng, 20, 60) if rng.random() < 0.6 else sentence(rng, 250, 450)
+        store.add("user", question)
+        store.add("assistant", reply)
+        builder.compact("bench")
+
+    print(json.dumps({
+        "turns": args.turns,
+        "budget": args.budget,
+        "token_counter": "tiktoken" if uses_tiktoken() else "estimate",
+        "history_tokens_per_turn": {
+            f"last_{args.window}_messages": describe(before),
+            "context_builder": describe(after),
+        },
+        "history_messages_per_turn": {
+            f"last_{args.window}_messages": round(statistics.mean(kept_before), 1),
+            "context_builder": round(statistics.mean(kept_after), 1),
+        },
+        "summary_tokens": count_tokens((store.get_session_summary("bench") or {}).get("summary", "")),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
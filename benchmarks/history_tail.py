@@ -0,0 +1,108 @@
+"""Benchmark the tail-window chat history query on long sessions.
+
+Seeds one session with --messages rows (plus some noise from other sessions)
+in a throwaway database, then times the old ``ORDER BY timestamp ASC LIMIT``
+query against ``DatabaseManager.get_recent_messages``.
+
+    python benchmarks/history_tail.py --messages 10000 --limit 8
+
+Uses the DB_HOST/DB_USER/DB_PASSWORD settings from .env. Rows left in the
+target database (default ``mix_master_bench``) by earlier runs are deleted.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="mix_master_bench")
+    parser.add_argument("--messages", type=int, default=10000, help="messages in the benchmarked session")
+    parser.add_argument("--other-sessions", type=int, default=200)
+    parser.add_argument("--other-messages", type=int, default=50, help="messages per noise session")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=200)
+    return parser.parse_args()
+
+
+def seed(db, session_id, count, batch_size=1000):
+    with db.connection() as conn, conn.cursor() as cursor:
+        for start in range(0, count, batch_size):
+            rows = [
+                (session_id, "user" if i % 2 == 0 else "assistant", f"message {i} " + "x" * 200)
+                for i in range(start, min(start + batch_size, count))
+            ]
+            cursor.executemany(
+                "INSERT INTO chat_messages (session_id, message_type, content) VALUES (%s, %s, %s)",
+                rows,
+            )
+
+
+def time_query(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    args = parse_args()
+    # Configure the manager before importing it: isolated database, no cache
+    os.environ["DB_NAME"] = args.database
+    os.environ["HISTORY_CACHE_ENABLED"] = "false"
+    os.environ["DB_WRITE_BEHIND"] = "false"
+    from database import db_manager
+
+    with db_manager.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM chat_messages WHERE session_id LIKE 'bench-%%'")
+
+    session_id = "bench-long-session"
+    for i in range(args.other_sessions):
+        seed(db_manager, f"bench-noise-{i}", args.other_messages)
+    seed(db_manager, session_id, args.messages)
+
+    def old_query():
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT message_type as role, content
+                FROM chat_messages
+                WHERE session_id = %s
+                ORDER BY timestamp ASC
+                LIMIT 50
+            """, (session_id,))
+            return cursor.fetchall()[-args.limit:]
+
+    def new_query():
+        return db_manager.get_recent_messages(session_id, args.limit)
+
+    with db_manager.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "EXPLAIN SELECT id FROM chat_messages WHERE session_id = %s ORDER BY id DESC LIMIT %s",
+            (session_id, args.limit),
+        )
+        plan = cursor.fetchall()
+
+    result = {
+        "messages": args.messages,
+        "limit": args.limit,
+        "repeat": args.repeat,
+        "oldest_50_by_timestamp": time_query(old_query, args.repeat),
+        "tail_window_by_id": time_query(new_query, args.repeat),
+        "tail_window_plan": [{k: row.get(k) for k in ("key", "rows", "Extra")} for row in plan],
+    }
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Measure peak Python memory per image request, before and after base64 passthrough.
+
+For each sample image, two kinds of measurement are taken with tracemalloc:
+
+* ingest: the image goes from the client's base64 data URL to the data URL
+  sent to OpenAI. The old path split, decoded, preprocessed and re-encoded
+  it. The current path is ``prepare_base64_image``, plus the same comparison
+  for multipart bytes.
+* request: a full ``POST /api/alcoholbot`` with ``image_base64``, run through
+  the chatbot app against the local OpenAI stub. It runs once with
+  passthrough disabled (IMAGE_PASSTHROUGH_MAX_BYTES=0) and once enabled.
+
+tracemalloc only sees allocations made through Python's allocator, so
+Pillow's pixel buffers are not counted. Those are the same on both paths
+whenever an image has to be preprocessed.
+
+    python benchmarks/image_memory.py --repeat 5 --output image_memory.json
+"""
+import io
+import os
+import sys
+import json
+import base64
+import random
+import argparse
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from stubs import StubConfig, start_stub_server  # noqa: E402
+
+# (name, size, format): a phone-sized upload, one already within limits, and a PNG
+SAMPLES = [
+    ("photo_4032x3024_jpeg", (4032, 3024), "JPEG"),
+    ("small_1024x768_jpeg", (1024, 768), "JPEG"),
+    ("small_800x800_png", (800, 800), "PNG"),
+]
+
+
+def make_image(size, image_format):
+    image = Image.new("RGB", size, tuple(random.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = random.randrange(size[0]), random.randrange(size[1])
+        draw.ellipse(
+            (x, y, x + random.randrange(20, 300), y + random.randrange(20, 300)),
+            fill=tuple(random.randrange(256) for _ in range(3)),
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **({"quality": 92} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def peak_kb(fn, repeat):
+    """Highest tracemalloc peak over ``repeat`` calls of ``fn``"""
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        try:
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return round(max(peaks) / 1024, 1)
+
+
+def legacy_base64_ingest(payload):
+    # The pre-passthrough JSON path in alcoholbot() and generate_*_image_analysis
+    from image_pipeline import preprocess_image
+    image_data = payload
+    if "," in image_data:
+        image_data = image_data.split(",")[1]
+    image_bytes = preprocess_image(base64.b64decode(image_data))
+    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+    return f"data:image/jpeg;base64,{image_b64}"
+
+
+def legacy_bytes_ingest(data):
+    from image_pipeline import preprocess_image
+    image_b64 = base64.b64encode(preprocess_image(data)).decode("utf-8")
+    return f"data:image/jpeg;base64,{image_b64}"
+
+
+def measure_ingest(samples, repeat):
+    from image_pipeline import prepare_base64_image, prepare_image
+    results = []
+    for name, data, mime in samples:
+        payload = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        results.append({
+            "image": name,
+            "bytes": len(data),
+            "base64_before_kb": peak_kb(lambda: legacy_base64_ingest(payload), repeat),
+            "base64_after_kb": peak_kb(lambda: prepare_base64_image(payload).data_url(), repeat),
+            "multipart_before_kb": peak_kb(lambda: legacy_bytes_ingest(data), repeat),
+            "multipart_after_kb": peak_kb(lambda: prepare_image(data).data_url(), repeat),
+        })
+    return results
+
+
+def measure_requests(samples, repeat):
+    import chatbot
+    import image_pipeline
+    client = chatbot.app.test_client()
+    passthrough_limit = image_pipeline.PASSTHROUGH_MAX_BYTES
+    results = []
+    for name, data, mime in samples:
+        payload = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        row = {"image": name, "bytes": len(data)}
+        for label, limit in (("before", 0), ("after", passthrough_limit)):
+            image_pipeline.PASSTHROUGH_MAX_BYTES = limit
+            # No session_id, so every run starts a new session with no history
+            body = {"image_base64": payload}
+            status = []
+            row[f"request_{label}_kb"] = peak_kb(
+                lambda: status.append(client.post("/api/alcoholbot", json=body).status_code), repeat
+            )
+            row[f"request_{label}_status"] = status[-1]
+        image_pipeline.PASSTHROUGH_MAX_BYTES = passthrough_limit
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the highest peak is kept")
+    parser.add_argument("--skip-requests", action="store_true", help="only measure ingestion")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    stubs = start_stub_server(StubConfig(llm_latency=0, tokens_per_second=0))
+    os.environ.update({
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stubs.server_address[1]}/v1",
+        "IMAGE_CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+
+    random.seed(7)
+    samples = [
+        (name, make_image(size, image_format), f"image/{image_format.lower()}")
+        for name, size, image_format in SAMPLES
+    ]
+    report = {"repeat": args.repeat, "ingest": measure_ingest(samples, args.repeat)}
+    if not args.skip_requests:
+        report["requests"] = measure_requests(samples, args.repeat)
+    stubs.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Load-test the HTTP endpoints against local OpenAI/Serper stand-ins.
+
+Starts the stubs from ``stubs.py`` and then ``server.py`` (every endpoint
+module in one process) in a subprocess pointed at them. Each scenario is
+driven at each concurrency level, and one JSON report is written with
+latency percentiles, throughput, errors and the server's peak RSS.
+
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 100 --output bench.json
+    python benchmarks/load_test.py --scenarios text,get_brands --error-rate 0.05
+
+Chat history goes to the MySQL database configured by the DB_* settings in
+.env, with DB_NAME defaulting to ``mix_master_bench``. Caches are in memory,
+and inputs vary per request unless --repeat-inputs is given, so the upstream
+path is what gets measured.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import base64
+import socket
+import argparse
+import itertools
+import platform
+import resource
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageDraw
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import add_stub_arguments, start_stub_server, stub_config  # noqa: E402
+
+ROOT = os.path.dirname(BENCH_DIR)
+SCENARIOS = [
+    "text", "image_multipart", "image_base64",
+    "get_brands", "alcohol_info", "generate_recipe", "drink_recommend",
+]
+LOCATIONS = ["Tokyo", "London", "Mexico City", "Lagos", "Lima", "Oslo", "Seoul", "Cape Town"]
+MOODS = ["happy", "relaxed", "romantic", "adventurous", "stressed", "celebratory"]
+WEATHERS = ["sunny", "rainy", "cold", "hot", "cloudy", "snowy"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--repeat-inputs", action="store_true", help="reuse identical inputs (measures caches)")
+    parser.add_argument("--server-threads", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request client timeout")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    add_stub_arguments(parser)
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_image(size=(1200, 900)):
+    # A photo-sized JPEG; random blocks give each one a different perceptual hash
+    image = Image.new("RGB", size, tuple(random.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(24):
+        x, y = random.randrange(size[0]), random.randrange(size[1])
+        draw.rectangle(
+            (x, y, x + random.randrange(50, 400), y + random.randrange(50, 300)),
+            fill=tuple(random.randrange(256) for _ in range(3)),
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Scenarios:
+    """Builds the next request for a scenario"""
+
+    def __init__(self, base_url, repeat_inputs):
+        self.base_url = base_url
+        self.repeat = repeat_inputs
+        self._repeated_image = make_image() if repeat_inputs else None
+        # Numbered across levels so later levels don't hit entries cached by earlier ones
+        self._numbers = itertools.count(1)
+
+    def tag(self, i):
+        return 0 if self.repeat else i
+
+    def image(self, i):
+        # A fresh image per request (built before its timer starts), so neither the
+        # perceptual-hash cache nor in-flight coalescing answers for OpenAI
+        return self._repeated_image if self.repeat else make_image()
+
+    def request(self, name):
+        i = next(self._numbers)
+        n = self.tag(i)
+        url = self.base_url
+        if name == "text":
+            return "POST", f"{url}/api/alcoholbot", {"json": {
+                "text": f"What can I mix with mezcal and grapefruit? ({n})",
+                "session_id": f"bench-text-{i % 50}",
+            }}
+        if name == "image_multipart":
+            return "POST", f"{url}/api/alcoholbot", {
+                "files": {"image": ("bottle.jpg", self.image(i), "image/jpeg")},
+                "data": {"session_id": f"bench-img-{i % 50}"},
+            }
+        if name == "image_base64":
+            return "POST", f"{url}/api/alcoholbot", {"json": {
+                "image_base64": base64.b64encode(self.image(i)).decode("ascii"),
+                "session_id": f"bench-b64-{i % 50}",
+            }}
+        if name == "get_brands":
+            return "GET", f"{url}/api/get-brands", {"params": {
+                "location": f"{LOCATIONS[i % len(LOCATIONS)]} {n}" if n else LOCATIONS[0],
+            }}
+        if name == "alcohol_info":
+            return "POST", f"{url}/alcohol-info", {"data": {
+                "brand_name": f"Old Harbor {n}", "description": "A smoky single malt.",
+            }}
+        if name == "generate_recipe":
+            return "POST", f"{url}/generate_recipe", {
+                "files": {"image": ("bottle.jpg", self.image(i), "image/jpeg")},
+                "data": {"name": f"Harbor Sour {n}", "category": "sour", "servings": "1",
+                         "ingredient_1": "whiskey", "quantity_1": "50 ml"},
+            }
+        if name == "drink_recommend":
+            return "POST", f"{url}/api/drink_recommend", {"json": {
+                "mood": MOODS[i % len(MOODS)],
+                "weather": WEATHERS[(i // len(MOODS)) % len(WEATHERS)],
+                "location": f"{LOCATIONS[i % len(LOCATIONS)]} {n}" if n else LOCATIONS[0],
+            }}
+        raise ValueError(f"Unknown scenario: {name}")
+
+
+class RSSSampler:
+    """Tracks the peak resident set size of a process while active"""
+
+    def __init__(self, pid, interval=0.05):
+        self.path = f"/proc/{pid}/status"
+        self.interval = interval
+        self.peak_kb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def __enter__(self):
+        self.peak_kb = 0 if self.available() else None
+        if self.peak_kb is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._stop.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with open(self.path) as status:
+                    for line in status:
+                        if line.startswith("VmRSS:"):
+                            self.peak_kb = max(self.peak_kb, int(line.split()[1]))
+                            break
+            except OSError:
+                return
+            self._stop.wait(self.interval)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * q))
+    return round(sorted_values[index], 1)
+
+
+def run_level(scenarios, name, concurrency, total, timeout, sampler):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(_):
+        method, url, kwargs = scenarios.request(name)
+        start = time.perf_counter()
+        try:
+            status = session.request(method, url, timeout=timeout, **kwargs).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+        return elapsed, status
+
+    with sampler, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(one, range(total)))
+        wall = time.perf_counter() - started
+
+    latencies = sorted(ms for ms, status in results if status == 200)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "status_counts": {str(k): v for k, v in statuses.items()},
+        "throughput_rps": round((total - errors) / wall, 2),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": round(latencies[-1], 1) if latencies else None,
+        },
+        "server_peak_rss_mb": round(sampler.peak_kb / 1024, 1) if sampler.peak_kb else None,
+    }
+
+
+def start_server(stub_url, port, threads):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "SERPER_API_KEY": "bench",
+        "SERPER_BASE_URL": f"{stub_url}/serper",
+        "SERVER_HOST": "127.0.0.1",
+        "SERVER_PORT": str(port),
+        "SERVER_THREADS": str(threads),
+        "DB_NAME": os.getenv("BENCH_DB_NAME", "mix_master_bench"),
+        "CACHE_BACKEND": "memory",
+        "SEARCH_CACHE_BACKEND": "memory",
+        "IMAGE_CACHE_ENABLED": env.get("IMAGE_CACHE_ENABLED", "true"),
+    })
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py")],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {server.returncode}")
+        try:
+            requests.get(f"{base_url}/api/health", timeout=1)
+            return server, base_url
+        except requests.RequestException:
+            time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("server.py did not start within 60s")
+
+
+def main():
+    args = parse_args()
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    stubs = start_stub_server(stub_config(args))
+    stub_url = f"http://127.0.0.1:{stubs.server_address[1]}"
+    server, base_url = start_server(stub_url, free_port(), args.server_threads)
+    try:
+        scenarios = Scenarios(base_url, args.repeat_inputs)
+        sampler = RSSSampler(server.pid)
+        results = []
+        for name in names:
+            for level in levels:
+                result = run_level(scenarios, name, level, args.requests, args.timeout, sampler)
+                results.append(result)
+                print(
+                    f"{name:16} c={level:<4} p50={result['latency_ms']['p50']}ms "
+                    f"p99={result['latency_ms']['p99']}ms {result['throughput_rps']} rps "
+                    f"errors={result['errors']}",
+                    file=sys.stderr,
+                )
+    finally:
+        server.terminate()
+        server.wait()
+        stubs.shutdown()
+
+    # Peak over the server's whole life (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "repeat_inputs": args.repeat_inputs,
+            "server_threads": args.server_threads,
+            "llm_latency": args.llm_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "completion_tokens": args.completion_tokens,
+            "error_rate": args.error_rate,
+            "serper_latency": args.serper_latency,
+        },
+        "server_peak_rss_mb": round(peak_mb, 1),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-ins for the OpenAI chat-completions and Serper APIs.
+
+Replies are shaped like the real APIs and like what each endpoint's prompt
+asks for (brand lists, recommendation JSON, free text). Latency, token rate
+and error rate are configurable. Run standalone to point a dev server at it:
+
+    python benchmarks/stubs.py --port 8900 --llm-latency 0.5 --tokens-per-second 60
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 SERPER_BASE_URL=http://127.0.0.1:8900/serper python server.py
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "smooth oak vanilla citrus peel spice caramel honey smoky peat rye malt botanical juniper "
+    "agave pepper cherry cocoa toffee crisp dry finish nose palate balanced bright warm long"
+).split()
+
+BRANDS = [
+    ("Old Harbor", "whiskey"), ("Blue Juniper", "gin"), ("Casa Sol", "tequila"),
+    ("Northern Birch", "vodka"), ("Cane & Co", "rum"), ("Valle Alto", "wine"),
+]
+
+
+class StubConfig:
+    def __init__(self, llm_latency=0.3, tokens_per_second=80.0, completion_tokens=120,
+                 error_rate=0.0, serper_latency=0.15):
+        self.llm_latency = llm_latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.serper_latency = serper_latency
+
+
+def words(count):
+    return " ".join(random.choice(WORDS) for _ in range(count))
+
+
+def prompt_text(messages):
+    return " ".join(
+        m["content"] if isinstance(m.get("content"), str)
+        else " ".join(p.get("text", "") for p in m.get("content", []) if p.get("type") == "text")
+        for m in messages
+    )
+
+
+def prompt_tokens(messages):
+    # About four characters per text token, plus OpenAI's flat-ish cost per image
+    images = sum(
+        1 for m in messages if isinstance(m.get("content"), list)
+        for p in m["content"] if p.get("type") == "image_url"
+    )
+    return len(prompt_text(messages)) // 4 + 765 * images
+
+
+def completion_text(messages, max_tokens, default_tokens):
+    prompt = prompt_text(messages)
+    if "alcohol brands" in prompt:
+        return json.dumps([
+            {"brand_name": name, "description": f"A {category} with {words(8)}.", "category": category}
+            for name, category in random.sample(BRANDS, 5)
+        ])
+    if '"food_pairings"' in prompt:
+        return json.dumps({
+            "drink": {
+                "name": f"{random.choice(BRANDS)[0]} Spritz", "type": "cocktail",
+                "alcohol_base": random.choice(BRANDS)[1], "description": words(20),
+                "alcohol_content": "12%",
+            },
+            "food_pairings": [{"name": f"Dish {i}", "description": words(10)} for i in range(3)],
+        })
+    # Roughly one word per token
+    return words(min(max_tokens or default_tokens, default_tokens))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            return self.send_json(200, {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") == "/v1/chat/completions":
+            return self.chat_completion(body)
+        if self.path.startswith("/serper/"):
+            return self.serper(self.path[len("/serper/"):], body)
+        self.send_json(404, {"error": "not found"})
+
+    def chat_completion(self, body):
+        config = self.config
+        if random.random() < config.error_rate:
+            status = random.choice([429, 500, 503])
+            headers = {"retry-after": "0.2"} if status == 429 else {}
+            return self.send_json(status, {"error": {"message": "stub error", "type": "stub"}}, headers)
+
+        time.sleep(config.llm_latency)
+        text = completion_text(body.get("messages", []), body.get("max_tokens"), config.completion_tokens)
+        tokens = text.split(" ")
+        prompt_count = prompt_tokens(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+
+        if not body.get("stream"):
+            time.sleep(delay * len(tokens))
+            return self.send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_count, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_count + len(tokens)},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            time.sleep(delay)
+            self.send_chunk(completion_id, body, token if i == 0 else " " + token, None)
+        self.send_chunk(completion_id, body, None, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.send_usage_chunk(completion_id, body, prompt_count, len(tokens))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def send_chunk(self, completion_id, body, content, finish_reason):
+        delta = {"content": content} if content is not None else {}
+        event = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def send_usage_chunk(self, completion_id, body, prompt_count, completion_count):
+        event = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"), "choices": [],
+            "usage": {"prompt_tokens": prompt_count, "completion_tokens": completion_count,
+                      "total_tokens": prompt_count + completion_count},
+        }
+        self.write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def serper(self, endpoint, body):
+        time.sleep(self.config.serper_latency)
+        query = body.get("q", "")
+        if endpoint == "images":
+            return self.send_json(200, {"images": [
+                {"title": query, "imageUrl": f"https://images.example.com/{uuid.uuid4().hex}.jpg"}
+            ]})
+        return self.send_json(200, {"organic": [
+            {"title": f"{query} {i}", "snippet": words(25)} for i in range(body.get("num", 3))
+        ]})
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """Serve the stubs on a background thread; returns the server (see server_address)"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="upstream-stubs", daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-tokens", type=int, default=120, help="length of free-text replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions failing with 429/5xx")
+    parser.add_argument("--serper-latency", type=float, default=0.15)
+
+
+def stub_config(args):
+    return StubConfig(
+        llm_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        serper_latency=args.serper_latency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = start_stub_server(stub_config(args), args.host, args.port)
+    print(f"Stubs listening on http://{args.host}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
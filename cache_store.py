@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory for on-disk caches
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+class MemoryCache:
+    """In-process LRU key/value store.
+
+    ``get`` returns ``(value, stored_at)`` and leaves freshness decisions to
+    the caller. Values are returned as stored, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() if stored_at is None else stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk key/value store backed by SQLite, surviving restarts.
+
+    Same interface as MemoryCache; values must be JSON serializable. Least
+    recently used entries are evicted once ``max_entries`` is exceeded.
+    """
+
+    # Reads only refresh the LRU timestamp when it is older than this
+    TOUCH_INTERVAL = 60
+    # Entries written between eviction checks
+    EVICT_EVERY = 100
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers proceed during writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, stored_at, accessed_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[2] > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at=None):
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now if stored_at is None else stored_at, now),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self._evict()
+
+    def delete(self, key):
+        return self._connection().execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount > 0
+
+    def delete_prefix(self, prefix):
+        return self._connection().execute(
+            "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        ).rowcount
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self):
+        try:
+            conn = self._connection()
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                conn.execute("""
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache ORDER BY accessed_at LIMIT ?
+                    )
+                """, (excess,))
+        except sqlite3.Error as e:
+            logging.warning(f"Cache eviction failed for {self.path}: {str(e)}")
+
+
+def make_cache(name, max_entries=1024, backend=None):
+    """Create a cache store; ``backend`` is "memory" or "sqlite" (default: CACHE_BACKEND)"""
+    backend = (backend or os.getenv("CACHE_BACKEND", "memory")).lower()
+    if backend == "sqlite":
+        return SQLiteCache(os.path.join(CACHE_DIR, f"{name}.sqlite3"), max_entries=max_entries)
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return MemoryCache(max_entries=max_entries)
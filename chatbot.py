@@ -1,21 +1,26 @@
 import os
-import io
+import json
 import uuid
-import base64
-import pymysql
+import hashlib
 import logging
-from flask import Flask, request, jsonify, send_file, send_from_directory
-from werkzeug.utils import secure_filename
-from PIL import Image
-from openai import OpenAI
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from dotenv import load_dotenv
 from flask_cors import CORS
 from database import db_manager
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+from image_pipeline import prepare_base64_image, prepare_image
+from image_cache import dhash, image_analysis_cache
+from context_builder import ContextBuilder
+from readiness import create_prober
+from clients import get_openai_client
+import singleflight
+from llm_scheduler import BACKGROUND, INTERACTIVE, chat_completion, scheduler
+from metrics import in_current_context, instrument, record_usage, stage
+from log_setup import attach_request_ids, bind_session, setup_logging
+from upload_limits import limit_uploads
+from image_jobs import DONE, FAILED, IMAGE_JOB_MAX_WAIT, ImageJobsFull, image_jobs
+
+# Configure logging (written by a background thread, see log_setup)
+setup_logging()
 
 # Load .env variables
 load_dotenv()
@@ -23,26 +28,28 @@ load_dotenv()
 # Flask setup
 app = Flask(__name__)
 CORS(app)
-
-app.config["UPLOAD_FOLDER"] = "static/uploads"
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-
-# Verify upload folder permissions
-try:
-    test_file = os.path.join(app.config["UPLOAD_FOLDER"], "test.txt")
-    with open(test_file, "w") as f:
-        f.write("test")
-    os.remove(test_file)
-    logging.info("Upload folder is writable")
-except Exception as e:
-    logging.error(f"Upload folder permission error: {str(e)}")
+instrument(app)
+attach_request_ids(app)
+limit_uploads(app)
 
 # OpenAI client
+client = None
 try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client()
     logging.info("OpenAI client initialized")
 except Exception as e:
-    logging.error(f"Failed to initialize OpenAI client: {str(e)}")
+    logging.error("Failed to initialize OpenAI client: %s", e)
+
+# Upstream status, refreshed in the background
+readiness = create_prober(client, checks=("openai", "database"))
+
+# Completion parameters per reply type, shared by the streaming and JSON paths
+STRUCTURED_IMAGE_PARAMS = {"model": "gpt-4o", "temperature": 0.3, "max_tokens": 1000}
+CONTEXTUAL_IMAGE_PARAMS = {"model": "gpt-4o", "temperature": 0.7, "max_tokens": 400}
+TEXT_PARAMS = {"model": "gpt-4o", "temperature": 0.7, "max_tokens": 300}
+
+# Coalesces identical structured image analyses that are in flight together
+structured_analysis_flight = singleflight.group("structured_image_analysis")
 
 
 # Serve frontend
@@ -55,15 +62,21 @@ def serve_chatbot():
     return send_file("chatbot.html")
 
 
-# Serve static uploads
-@app.route("/static/uploads/<path:filename>")
-def serve_uploaded_file(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
-
 # Health check endpoint
 @app.route("/api/health")
 def health_check():
-    return jsonify({"status": "healthy", "service": "Mix Master AI"})
+    status = readiness.status()
+    return jsonify({
+        "status": "healthy" if status["ready"] else "degraded",
+        "service": "Mix Master AI",
+        "checks": status["checks"],
+    })
+
+# Readiness endpoint for load balancers: 503 until every upstream check passes
+@app.route("/ready")
+def ready():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 # Analytics endpoint
 @app.route("/api/analytics")
@@ -72,9 +85,29 @@ def get_analytics():
         analytics = db_manager.get_analytics()
         return jsonify({"success": True, "analytics": analytics})
     except Exception as e:
-        logging.error(f"Analytics error: {str(e)}")
+        logging.error("Analytics error: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Database pool, write queue and history cache metrics endpoint
+@app.route("/api/db/stats")
+def get_db_stats():
+    return jsonify({
+        "success": True,
+        "pool": db_manager.get_pool_stats(),
+        "write_behind": db_manager.get_writer_stats(),
+        "history_cache": db_manager.get_history_cache_stats(),
+    })
+
+# OpenAI scheduler queue depth, wait times and retries per priority class
+@app.route("/api/llm/stats")
+def get_llm_stats():
+    return jsonify({"success": True, "scheduler": scheduler.stats()})
+
+# Coalesced upstream calls per single-flight group in this process
+@app.route("/api/singleflight/stats")
+def get_singleflight_stats():
+    return jsonify({"success": True, "groups": singleflight.stats()})
+
 # Session stats endpoint
 @app.route("/api/session/<session_id>/stats")
 def get_session_stats(session_id):
@@ -85,29 +118,10 @@ def get_session_stats(session_id):
         else:
             return jsonify({"success": False, "error": "Session not found"}), 404
     except Exception as e:
-        logging.error(f"Session stats error: {str(e)}")
+        logging.error("Session stats error: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-# Database connection helper
-def get_db():
-    try:
-        conn = pymysql.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            db=os.getenv("DB_NAME"),
-            charset="utf8mb4",
-            cursorclass=pymysql.cursors.DictCursor,
-            autocommit=True,
-        )
-        logging.info("Database connection established")
-        return conn
-    except Exception as e:
-        logging.error(f"Database connection failed: {str(e)}")
-        raise
-
-
 # Check if message or previous message is relevant
 def is_alcohol_related(message, session_id):
     if not message:
@@ -120,15 +134,59 @@ def save_message(session_id, message_type, content):
     return db_manager.save_message(session_id, message_type, content)
 
 
-# Retrieve full chat history by session_id, oldest first
-def get_chat_history(session_id):
-    return db_manager.get_chat_history(session_id)
+# Retrieve the last `limit` messages by session_id, oldest first
+def get_chat_history(session_id, limit=50):
+    return db_manager.get_chat_history(session_id, limit)
+
+
+# Save a completed user/assistant exchange
+def save_turn(session_id, user_content, reply):
+    save_message(session_id, "user", user_content)
+    save_message(session_id, "assistant", reply)
+
+
+# Fold older turns into a session's rolling summary (used by the context builder)
+def summarize_history(previous_summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    response = chat_completion(
+        BACKGROUND,
+        model=os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini"),
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "You maintain a running summary of a conversation between a user and ARIA, a mixologist "
+                    "assistant. Update the summary with the new messages. Keep the drinks, brands, recipes, "
+                    "preferences and open questions that later replies may refer back to. "
+                    "Reply with the summary only, in at most 150 words."
+                ),
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}",
+            },
+        ],
+        temperature=0.2,
+        max_tokens=300,
+    )
+    return response.choices[0].message.content.strip()
+
+
+# Token-budgeted history with rolling summaries of older turns
+context_builder = ContextBuilder(
+    db_manager,
+    summarize_history,
+    budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+    compact_after=int(os.getenv("CONTEXT_COMPACT_AFTER", "6")),
+)
+IMAGE_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_IMAGE_TOKEN_BUDGET", "1000"))
 
 
 # Clear chat history endpoint
 @app.route("/api/alcoholbot/clear", methods=["POST"])
 def clear_history():
     session_id = request.json.get("session_id")
+    bind_session(session_id)
     if not session_id:
         logging.error("Clear history failed: session_id required")
         return jsonify({"success": False, "error": "session_id required"}), 400
@@ -140,12 +198,12 @@ def clear_history():
         else:
             return jsonify({"success": False, "error": "Failed to clear history"}), 500
     except Exception as e:
-        logging.error(f"Clear history error: {str(e)}")
+        logging.error("Clear history error: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-# Generate image analysis response from OpenAI
-def generate_image_analysis(image_bytes):
+# Build the OpenAI messages for a structured analysis of an image-only upload
+def build_structured_image_messages(image):
     prompt = (
         "You are ARIA, an expert mixologist and alcohol identification specialist. "
         "Analyze this image thoroughly and provide a comprehensive response about the drink/bottle shown. "
@@ -158,9 +216,9 @@ def generate_image_analysis(image_bytes):
         "🍸 **Alcohol Content**: [ABV percentage if visible]\n"
         "🌾 **Main Ingredient**: [Primary base spirit/ingredient]\n"
         "💫 **Tasting Notes**: [Flavor profile, characteristics]\n"
-        "� **Similar Items**: [3+ recommendations of similar products]\n"
+        "🍷 **Similar Items**: [3+ recommendations of similar products]\n"
         "🍹 **Cocktail Ideas**: [2-3 specific cocktail suggestions using this item]\n"
-        "� **Price Range**: [Typical price range if known]\n"
+        "💰 **Price Range**: [Typical price range if known]\n"
         "🔥 **Fun Fact**: [Interesting fact about this drink/brand]\n\n"
         
         "End with: 'Want to try something similar? Here's a few recommendations:' followed by your suggestions.\n"
@@ -169,253 +227,375 @@ def generate_image_analysis(image_bytes):
         "Be engaging, informative, and encourage follow-up questions. "
         "If you can't identify something clearly, be honest but still provide helpful general information about what you can see."
     )
-    try:
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        logging.info("Image encoded to base64")
+    image_url = image.data_url()
 
-        messages = [
-            {"role": "system", "content": "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of alcoholic and non-alcoholic beverages, cocktails, spirits, wines, and their origins. Provide detailed, helpful, and engaging responses."},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                    },
-                ],
-            },
-        ]
+    return [
+        {"role": "system", "content": "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of alcoholic and non-alcoholic beverages, cocktails, spirits, wines, and their origins. Provide detailed, helpful, and engaging responses."},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url},
+                },
+            ],
+        },
+    ]
+
+
+# Look up a stored structured analysis of a near-duplicate image.
+# Returns (image_hash, cached_reply); both are None when caching is disabled.
+def lookup_structured_analysis(image):
+    if image_analysis_cache is None:
+        return None, None
+    image_hash = dhash(image.raw)
+    cached = image_analysis_cache.get(image_hash, "structured")
+    if cached is not None:
+        logging.info("Structured image analysis served from perceptual-hash cache")
+    return image_hash, cached
+
+
+# Store a successful structured analysis for future near-duplicate uploads
+def remember_structured_analysis(image_hash, reply):
+    if image_hash is not None and reply:
+        image_analysis_cache.put(image_hash, "structured", reply)
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=1000,
+
+# Ask OpenAI for a structured analysis and cache it for near-duplicate uploads
+def request_structured_analysis(image, image_hash):
+    try:
+        response = chat_completion(
+            INTERACTIVE,
+            messages=build_structured_image_messages(image),
+            **STRUCTURED_IMAGE_PARAMS,
         )
-        logging.info("Image analysis response received from OpenAI")
-        return response.choices[0].message.content.strip()
+        logging.info("Structured image analysis response received from OpenAI")
+        reply = response.choices[0].message.content.strip()
+        remember_structured_analysis(image_hash, reply)
+        return reply
     except Exception as e:
-        logging.error(f"Image analysis failed: {str(e)}")
+        logging.error("Structured image analysis failed: %s", e)
         return f"Error processing image: {str(e)}"
 
 
 # Generate structured image analysis response for image-only uploads
-def generate_structured_image_analysis(image_bytes):
-    prompt = (
-        "You are ARIA, an expert mixologist and alcohol identification specialist. "
-        "Analyze this image thoroughly and provide a comprehensive response about the drink/bottle shown. "
-        "Be conversational, informative, and helpful. Include the following information naturally in your response:\n\n"
-        
-        "Start with: 'Got it! Here's what I found:'\n\n"
-        
-        "🔍 **Identified Item**: [Specific name and brand]\n"
-        "🌍 **Origin**: [Country/region of origin]\n" 
-        "🍸 **Alcohol Content**: [ABV percentage if visible]\n"
-        "🌾 **Main Ingredient**: [Primary base spirit/ingredient]\n"
-        "💫 **Tasting Notes**: [Flavor profile, characteristics]\n"
-        "🍷 **Similar Items**: [3+ recommendations of similar products]\n"
-        "🍹 **Cocktail Ideas**: [2-3 specific cocktail suggestions using this item]\n"
-        "💰 **Price Range**: [Typical price range if known]\n"
-        "🔥 **Fun Fact**: [Interesting fact about this drink/brand]\n\n"
-        
-        "End with: 'Want to try something similar? Here's a few recommendations:' followed by your suggestions.\n"
-        "Then ask: 'What would you like to know more about? 🍹'\n\n"
-        
-        "Be engaging, informative, and encourage follow-up questions. "
-        "If you can't identify something clearly, be honest but still provide helpful general information about what you can see."
+def generate_structured_image_analysis(image):
+    image_hash, cached = lookup_structured_analysis(image)
+    if cached is not None:
+        return cached
+    # Concurrent uploads of the same (or a near-identical) image share one call.
+    # Low-detail images share hashes without being alike, so those need the exact bytes.
+    if image_hash is not None and image_analysis_cache.is_distinctive(image_hash):
+        flight_key = image_hash
+    else:
+        flight_key = hashlib.sha256(image.raw).hexdigest()
+    return structured_analysis_flight.do(
+        flight_key, request_structured_analysis, image, image_hash
     )
-    try:
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        logging.info("Image encoded to base64 for structured analysis")
 
-        messages = [
-            {"role": "system", "content": "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of alcoholic and non-alcoholic beverages, cocktails, spirits, wines, and their origins. Provide detailed, helpful, and engaging responses."},
+
+# Build the OpenAI messages for an image sent together with a text message
+def build_contextual_image_messages(image, user_message, session_id):
+    # Get chat history for context
+    limited_history = context_builder.history(session_id, budget=IMAGE_CONTEXT_TOKEN_BUDGET)
+
+    image_url = image.data_url()
+
+    # Build messages with conversation history and image
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of "
+                "alcoholic and non-alcoholic beverages, cocktails, spirits, wines, beers, and their origins. "
+                "The user has sent you an image along with a text message. Analyze the image in the context "
+                "of their message and conversation history. Provide helpful, detailed, and engaging responses "
+                "about drinks, cocktails, ingredients, recipes, recommendations, and related topics. "
+                "Be conversational and encouraging. Always consider the conversation history and context. "
+                "Always end with a follow-up question or suggestion to keep the conversation going. "
+                "Use emojis appropriately to make responses more engaging."
+            ),
+        }
+    ]
+    
+    # Add conversation history
+    messages.extend(limited_history)
+    
+    # Add current message with image
+    messages.append({
+        "role": "user",
+        "content": [
+            {"type": "text", "text": user_message},
             {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                    },
-                ],
+                "type": "image_url",
+                "image_url": {"url": image_url},
             },
-        ]
+        ],
+    })
+    return messages
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=1000,
-        )
-        logging.info("Structured image analysis response received from OpenAI")
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        logging.error(f"Structured image analysis failed: {str(e)}")
-        return f"Error processing image: {str(e)}"
+
+# Save a contextual image turn once the reply is complete
+def save_contextual_image_turn(session_id, user_message, reply):
+    save_turn(session_id, f"{user_message} [Image included]", reply)
 
 
 # Generate contextual image analysis response when text accompanies image
-def generate_contextual_image_analysis(image_bytes, user_message, session_id):
-    # Get chat history for context
-    full_history = get_chat_history(session_id)
-    limited_history = full_history[-6:]  # Last 6 messages for context
-    
+def generate_contextual_image_analysis(image, user_message, session_id):
     try:
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        logging.info("Image encoded to base64 for contextual analysis")
-
-        # Build messages with conversation history and image
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of "
-                    "alcoholic and non-alcoholic beverages, cocktails, spirits, wines, beers, and their origins. "
-                    "The user has sent you an image along with a text message. Analyze the image in the context "
-                    "of their message and conversation history. Provide helpful, detailed, and engaging responses "
-                    "about drinks, cocktails, ingredients, recipes, recommendations, and related topics. "
-                    "Be conversational and encouraging. Always consider the conversation history and context. "
-                    "Always end with a follow-up question or suggestion to keep the conversation going. "
-                    "Use emojis appropriately to make responses more engaging."
-                ),
-            }
-        ]
-        
-        # Add conversation history
-        messages.extend(limited_history)
-        
-        # Add current message with image
-        messages.append({
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_message},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                },
-            ],
-        })
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=400,
+        response = chat_completion(
+            INTERACTIVE,
+            messages=build_contextual_image_messages(image, user_message, session_id),
+            **CONTEXTUAL_IMAGE_PARAMS,
         )
         
         reply = response.choices[0].message.content.strip()
         logging.info("Contextual image analysis response received from OpenAI")
         
         # Save the conversation
-        save_message(session_id, "user", f"{user_message} [Image included]")
-        save_message(session_id, "assistant", reply)
+        save_contextual_image_turn(session_id, user_message, reply)
         
         return reply
     except Exception as e:
-        logging.error(f"Contextual image analysis failed: {str(e)}")
+        logging.error("Contextual image analysis failed: %s", e)
         return f"Error processing image with context: {str(e)}"
 
 
+# Build the OpenAI messages for a text turn with recent history
+def build_text_messages(session_id, message):
+    limited_history = context_builder.history(session_id)
+    limited_history.append({"role": "user", "content": message})
+    
+    # Log context for debugging
+    logging.debug("Chat context for session %s: %s messages", session_id, len(limited_history))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for i, msg in enumerate(limited_history):
+            logging.debug("Message %s: %s - %s...", i, msg["role"], msg["content"][:100])
+
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of "
+                "alcoholic and non-alcoholic beverages, cocktails, spirits, wines, beers, and their origins. "
+                "Provide helpful, detailed, and engaging responses about drinks, cocktails, ingredients, "
+                "recipes, recommendations, and related topics. Be conversational and encouraging. "
+                "IMPORTANT: Always consider the conversation history and context. If the user asks follow-up "
+                "questions like 'where can I find them' or 'how much do they cost', refer back to what you "
+                "previously discussed (specific drinks, brands, or recommendations you mentioned). "
+                "Always end with a follow-up question or suggestion to keep the conversation going. "
+                "Use emojis appropriately to make responses more engaging."
+            ),
+        },
+        *limited_history,
+    ]
+
+
+# Save a text turn once the reply is complete
+def save_text_turn(session_id, message, reply):
+    save_turn(session_id, message, reply)
+
+
 # Generate text response with last 5 messages
 def generate_text_response(session_id, message):
     if not is_alcohol_related(message, session_id):
-        logging.info(f"Message '{message}' accepted")
+        logging.debug("Message '%s' accepted", message)
         return "❌ Sorry, I couldn't process that! Try asking something else. 🍷"
 
-    full_history = get_chat_history(session_id)
-    full_history.append({"role": "user", "content": message})
-    limited_history = full_history[-8:]  # Increased from 5 to 8 for better context
-    
-    # Log context for debugging
-    logging.info(f"Chat context for session {session_id}: {len(limited_history)} messages")
-    for i, msg in enumerate(limited_history):
-        logging.info(f"Message {i}: {msg['role']} - {msg['content'][:100]}...")
-
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are ARIA, an expert mixologist and drink advisor. You're knowledgeable about all types of "
-                        "alcoholic and non-alcoholic beverages, cocktails, spirits, wines, beers, and their origins. "
-                        "Provide helpful, detailed, and engaging responses about drinks, cocktails, ingredients, "
-                        "recipes, recommendations, and related topics. Be conversational and encouraging. "
-                        "IMPORTANT: Always consider the conversation history and context. If the user asks follow-up "
-                        "questions like 'where can I find them' or 'how much do they cost', refer back to what you "
-                        "previously discussed (specific drinks, brands, or recommendations you mentioned). "
-                        "Always end with a follow-up question or suggestion to keep the conversation going. "
-                        "Use emojis appropriately to make responses more engaging."
-                    ),
-                },
-                *limited_history,
-            ],
-            temperature=0.7,
-            max_tokens=300,
+        response = chat_completion(
+            INTERACTIVE,
+            messages=build_text_messages(session_id, message),
+            **TEXT_PARAMS,
         )
         reply = response.choices[0].message.content.strip()
-        logging.info(f"Text response generated: {reply[:50]}...")
-        save_message(session_id, "user", message)
-        save_message(session_id, "assistant", reply)
+        logging.debug("Text response generated: %s...", reply[:50])
+        save_text_turn(session_id, message, reply)
         return reply
     except Exception as e:
-        logging.error(f"Text processing failed: {str(e)}")
+        logging.error("Text processing failed: %s", e)
         return f"Error processing text: {str(e)}"
 
 
+# Format one server-sent event
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# Stream an OpenAI completion as server-sent events.
+# Emits a "delta" event per token chunk, then calls on_complete(reply) to
+# persist the turn and finishes with a "done" event shaped like the JSON reply.
+def stream_completion(messages, params, session_id, response_key, on_complete):
+    parts = []
+    try:
+        stream = chat_completion(
+            INTERACTIVE, messages=messages, stream=True,
+            stream_options={"include_usage": True}, **params,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                # The final chunk carries token usage and no choices
+                record_usage(chunk.model, chunk.usage)
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        reply = "".join(parts).strip()
+        logging.info("Streamed %s completed for session %s", response_key, session_id)
+        on_complete(reply)
+        yield sse_event(
+            {"success": True, "session_id": session_id, response_key: reply},
+            event="done",
+        )
+    except Exception as e:
+        logging.error("Streaming failed: %s", e)
+        yield sse_event({"success": False, "error": f"Streaming failed: {str(e)}"}, event="error")
+
+
+# Send an already known reply (e.g. from a cache) using the streaming protocol
+def replay_reply(reply, session_id, response_key, on_complete):
+    yield sse_event({"delta": reply})
+    on_complete(reply)
+    yield sse_event(
+        {"success": True, "session_id": session_id, response_key: reply},
+        event="done",
+    )
+
+
+# Wrap an event generator in a text/event-stream response
+def sse_response(events):
+    return Response(
+        stream_with_context(in_current_context(events)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Whether a boolean option is set in the query string, form or JSON body
+def request_flag(name):
+    value = request.args.get(name) or request.form.get(name)
+    if value is None and request.is_json:
+        value = request.json.get(name)
+    return str(value).lower() in ("1", "true", "yes")
+
+
+# Whether the client asked for a streamed (SSE) reply
+def wants_stream():
+    return request_flag("stream")
+
+
+# Whether the client asked for a 202 + job ID instead of waiting for the analysis
+def wants_async():
+    return request_flag("async")
+
+
+# Analyze an uploaded image and save the turn; with text, the text is answered in context
+def analyze_image(image, message, session_id, upload_label):
+    if message and message.strip():
+        # User provided text with image - use contextual analysis
+        logging.info("Using contextual image analysis (text + image)")
+        return generate_contextual_image_analysis(image, message, session_id)
+
+    # Image only - use structured analysis
+    logging.info("Using structured image analysis (image only)")
+    image_response = generate_structured_image_analysis(image)
+    save_turn(session_id, upload_label, image_response)
+    return image_response
+
+
+# Queue the analysis on the image job pool and answer 202 with the job to poll
+def queue_image_reply(image, message, session_id, upload_label):
+    try:
+        job = image_jobs.submit(session_id, analyze_image, image, message, session_id, upload_label)
+    except ImageJobsFull as e:
+        logging.warning("Image job rejected: %s", e)
+        response = jsonify({"success": False, "error": "Too many image analyses in progress, retry shortly."})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    status_url = f"/api/alcoholbot/jobs/{job['job_id']}"
+    logging.info("Queued image job %s for session %s", job["job_id"], session_id)
+    response = jsonify({
+        "success": True,
+        "session_id": session_id,
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": status_url,
+    })
+    response.headers["Location"] = status_url
+    return response, 202
+
+
+# Stream the reply to an uploaded image, with or without accompanying text
+def stream_image_reply(image, message, session_id, upload_label):
+    if message and message.strip():
+        logging.info("Streaming contextual image analysis (text + image)")
+        messages = build_contextual_image_messages(image, message, session_id)
+        return sse_response(stream_completion(
+            messages, CONTEXTUAL_IMAGE_PARAMS, session_id, "image_response",
+            lambda reply: save_contextual_image_turn(session_id, message, reply),
+        ))
+
+    image_hash, cached = lookup_structured_analysis(image)
+
+    def save_image_turn(reply):
+        save_turn(session_id, upload_label, reply)
+        if cached is None:
+            remember_structured_analysis(image_hash, reply)
+
+    if cached is not None:
+        return sse_response(replay_reply(cached, session_id, "image_response", save_image_turn))
+
+    logging.info("Streaming structured image analysis (image only)")
+    messages = build_structured_image_messages(image)
+    return sse_response(stream_completion(
+        messages, STRUCTURED_IMAGE_PARAMS, session_id, "image_response", save_image_turn,
+    ))
+
+
 # Main API endpoint
 @app.route("/api/alcoholbot", methods=["POST"])
 def alcoholbot():
     try:
         response_data = {}
-        session_id = (
-            request.form.get("session_id")
-            or (request.json.get("session_id") if request.is_json else None)
-            or str(uuid.uuid4())
-        )
-        logging.info(f"Processing request for session {session_id}")
-
-        # Get text message first to determine handling strategy
-        message = request.form.get("message") or (
-            request.json.get("text") if request.is_json else None
-        )
+        with stage("parse"):
+            stream = wants_stream()
+            run_async = wants_async()
+            session_id = (
+                request.form.get("session_id")
+                or (request.json.get("session_id") if request.is_json else None)
+                or str(uuid.uuid4())
+            )
+
+            # Get text message first to determine handling strategy
+            message = request.form.get("message") or (
+                request.json.get("text") if request.is_json else None
+            )
+            image_file = request.files.get("image")
+        bind_session(session_id)
+        logging.info("Processing request for session %s", session_id)
 
         # Handle image via form-data
-        image_file = request.files.get("image")
         if image_file and image_file.filename:
-            filename = secure_filename(f"{uuid.uuid4()}_{image_file.filename}")
-            path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            logging.info(f"Saving image to {path}")
+            logging.info("Processing uploaded image %s", image_file.filename)
             try:
-                image_file.save(path)
-                image = Image.open(path).convert("RGB")
-                byte_stream = io.BytesIO()
-                image.save(byte_stream, format="JPEG")
-                image_bytes = byte_stream.getvalue()
-                logging.info("Image processed successfully")
-
-                # Decide which image analysis function to use
-                if message and message.strip():
-                    # User provided text with image - use contextual analysis
-                    logging.info("Using contextual image analysis (text + image)")
-                    image_response = generate_contextual_image_analysis(image_bytes, message, session_id)
-                    response_data["image_response"] = image_response
-                    # Don't process text separately since it's handled in contextual analysis
-                    message = None
-                else:
-                    # Image only - use structured analysis
-                    logging.info("Using structured image analysis (image only)")
-                    image_response = generate_structured_image_analysis(image_bytes)
-                    response_data["image_response"] = image_response
-                    response_data["uploaded_image"] = f"/{path.replace(os.sep, '/')}"
-                    save_message(session_id, "user", "[Image Uploaded]")
-                    save_message(session_id, "assistant", image_response)
-                    
+                image = prepare_image(image_file.read())
+                logging.debug("Image processed successfully")
+
+                if stream:
+                    return stream_image_reply(image, message, session_id, "[Image Uploaded]")
+                if run_async:
+                    return queue_image_reply(image, message, session_id, "[Image Uploaded]")
+
+                response_data["image_response"] = analyze_image(image, message, session_id, "[Image Uploaded]")
+                # Any text was answered together with the image
+                message = None
+
             except Exception as e:
-                logging.error(f"Image processing failed: {str(e)}")
+                logging.error("Image processing failed: %s", e)
                 return (
                     jsonify(
                         {
@@ -425,38 +605,25 @@ def alcoholbot():
                     ),
                     400,
                 )
-            finally:
-                if os.path.exists(path):
-                    os.remove(path)
-                    logging.info(f"Deleted temporary image file {path}")
 
         # Handle image via JSON base64
         elif request.is_json and request.json.get("image_base64"):
-            image_data = request.json["image_base64"]
             logging.info("Processing base64 image")
-            if "," in image_data:
-                image_data = image_data.split(",")[1]
             try:
-                image_bytes = base64.b64decode(image_data)
-                
-                # Decide which image analysis function to use
-                if message and message.strip():
-                    # User provided text with image - use contextual analysis
-                    logging.info("Using contextual image analysis (text + image)")
-                    image_response = generate_contextual_image_analysis(image_bytes, message, session_id)
-                    response_data["image_response"] = image_response
-                    # Don't process text separately since it's handled in contextual analysis
-                    message = None
-                else:
-                    # Image only - use structured analysis
-                    logging.info("Using structured image analysis (image only)")
-                    image_response = generate_structured_image_analysis(image_bytes)
-                    response_data["image_response"] = image_response
-                    save_message(session_id, "user", "[Image Base64]")
-                    save_message(session_id, "assistant", image_response)
-                    
+                # Acceptable JPEG/PNG payloads go to OpenAI without being decoded
+                image = prepare_base64_image(request.json["image_base64"])
+
+                if stream:
+                    return stream_image_reply(image, message, session_id, "[Image Base64]")
+                if run_async:
+                    return queue_image_reply(image, message, session_id, "[Image Base64]")
+
+                response_data["image_response"] = analyze_image(image, message, session_id, "[Image Base64]")
+                # Any text was answered together with the image
+                message = None
+
             except Exception as e:
-                logging.error(f"Base64 image processing failed: {str(e)}")
+                logging.error("Base64 image processing failed: %s", e)
                 return (
                     jsonify(
                         {
@@ -469,6 +636,11 @@ def alcoholbot():
 
         # Handle remaining text message (only if not processed with image)
         if message and message.strip():
+            if stream and is_alcohol_related(message, session_id):
+                return sse_response(stream_completion(
+                    build_text_messages(session_id, message), TEXT_PARAMS, session_id, "text_response",
+                    lambda reply: save_text_turn(session_id, message, reply),
+                ))
             text_response = generate_text_response(session_id, message)
             response_data["text_response"] = text_response
 
@@ -478,13 +650,40 @@ def alcoholbot():
 
         response_data["success"] = True
         response_data["session_id"] = session_id
-        logging.info(f"Response sent for session {session_id}")
+        logging.info("Response sent for session %s", session_id)
         return jsonify(response_data)
 
     except Exception as e:
-        logging.error(f"Server error: {str(e)}")
+        logging.error("Server error: %s", e)
         return jsonify({"success": False, "error": f"Server error: {str(e)}"}), 500
 
 
+# Result of an async image analysis; ?wait=<seconds> long-polls until it finishes
+@app.route("/api/alcoholbot/jobs/<job_id>", methods=["GET"])
+def get_image_job(job_id):
+    try:
+        wait = min(max(float(request.args.get("wait") or 0), 0.0), IMAGE_JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"success": False, "error": "wait must be a number of seconds"}), 400
+
+    job = image_jobs.get(job_id, wait)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+
+    body = {
+        "success": job["status"] != FAILED,
+        "job_id": job_id,
+        "session_id": job["session_id"],
+        "status": job["status"],
+    }
+    if job["status"] == DONE:
+        body["image_response"] = job["result"]
+        return jsonify(body)
+    if job["status"] == FAILED:
+        body["error"] = f"Image processing failed: {job['error']}"
+        return jsonify(body), 500
+    return jsonify(body), 202
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,35 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+# Connections kept open per upstream host; should cover the expected in-flight requests
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+
+_openai_client = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, creating it on first use.
+
+    One client means one connection pool for every module, so keep-alive
+    connections are reused across endpoints. Retries are left to
+    llm_scheduler, which backs off across all callers.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _openai_lock:
+            if _openai_client is None:
+                _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _openai_client
+
+
+# Shared HTTP session for Serper and other plain HTTP upstreams
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE))
+http_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE))
@@ -0,0 +1,183 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import stage
+
+load_dotenv()
+
+# Per-message framing overhead the chat format adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+# Flat estimate for an image part; the real cost depends on size and detail
+IMAGE_PART_TOKENS = 765
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # tiktoken is optional and may need to download its tables on first use,
+    # so fall back to a character-based estimate if it isn't usable
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(os.getenv("TOKEN_ENCODING", "o200k_base"))
+                except Exception as e:
+                    logging.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def uses_tiktoken():
+    """Whether token counts are exact (tiktoken) rather than estimated"""
+    return _get_encoding() is not None
+
+
+def count_tokens(text):
+    """Count tokens in a string locally"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly four characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message):
+    """Count the tokens a chat message adds to a prompt"""
+    content = message.get("content")
+    if isinstance(content, list):
+        total = 0
+        for part in content:
+            if part.get("type") == "text":
+                total += count_tokens(part.get("text", ""))
+            else:
+                total += IMAGE_PART_TOKENS
+    else:
+        total = count_tokens(content)
+    return total + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_message(summary):
+    return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
+
+class ContextBuilder:
+    """Builds chat history for a prompt within a token budget.
+
+    Recent messages are added newest-first until ``budget`` tokens are used.
+    Messages that no longer fit are folded into a per-session rolling summary
+    stored in the database. Whenever ``history`` has to cut messages, the
+    summary is refreshed incrementally in the background (once at least
+    ``compact_after`` messages have fallen out of the budget) and is
+    prepended to what is sent.
+
+    ``db`` must provide ``get_recent_messages``, ``get_session_summary`` and
+    ``save_session_summary``. ``summarize(previous_summary, messages)``
+    returns the new summary text.
+    """
+
+    def __init__(self, db, summarize=None, budget=1500, window=50, compact_after=6, max_workers=2):
+        self.db = db
+        self.summarize = summarize
+        self.budget = budget
+        self.window = window
+        self.compact_after = compact_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="context-compactor")
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def history(self, session_id, budget=None):
+        """Return the history messages to send, oldest first"""
+        budget = self.budget if budget is None else budget
+        with stage("history_fetch"):
+            recent = self.db.get_recent_messages(session_id, self.window)
+
+            summary = None
+            if len(recent) >= self.window or self._tokens(recent) > budget:
+                # History was (or will be) cut, so the summary is worth a lookup
+                summary = self.db.get_session_summary(session_id)
+
+        remaining = budget
+        if summary:
+            summary_msg = summary_message(summary["summary"])
+            remaining -= message_tokens(summary_msg)
+
+        kept = self._fit_newest(recent, remaining)
+        if len(kept) < len(recent):
+            # Messages fell out of the budget; fold them into the summary
+            self.schedule_compaction(session_id)
+            if summary:
+                return [summary_msg, *kept]
+        return kept
+
+    def schedule_compaction(self, session_id):
+        """Refresh the session's rolling summary in the background"""
+        if self.summarize is None:
+            return
+        with self._lock:
+            if session_id in self._compacting:
+                return
+            self._compacting.add(session_id)
+        self._executor.submit(self._compact_safely, session_id)
+
+    def compact(self, session_id):
+        """Fold messages that no longer fit the budget into the summary.
+
+        Returns True if the summary was updated.
+        """
+        summary = self.db.get_session_summary(session_id)
+        previous = summary["summary"] if summary else ""
+        after_id = summary["last_message_id"] if summary else 0
+
+        # Everything not yet summarized, oldest first
+        pending = self.db.get_recent_messages(
+            session_id, self.window * 4, after_id=after_id, include_ids=True
+        )
+        remaining = self.budget - (message_tokens(summary_message(previous)) if previous else 0)
+        kept = self._fit_newest(pending, remaining)
+        overflow = pending[:len(pending) - len(kept)]
+        if len(overflow) < self.compact_after:
+            return False
+
+        new_summary = self.summarize(
+            previous, [{"role": m["role"], "content": m["content"]} for m in overflow]
+        )
+        if not new_summary:
+            return False
+        self.db.save_session_summary(session_id, new_summary, overflow[-1]["id"])
+        logging.info(f"Compacted {len(overflow)} messages into the summary for session {session_id}")
+        return True
+
+    def _compact_safely(self, session_id):
+        try:
+            self.compact(session_id)
+        except Exception as e:
+            logging.error(f"Context compaction failed for session {session_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+    @staticmethod
+    def _tokens(messages):
+        return sum(message_tokens(m) for m in messages)
+
+    @staticmethod
+    def _fit_newest(messages, budget):
+        # Longest suffix of messages that fits in the budget
+        used = 0
+        start = len(messages)
+        while start > 0:
+            cost = message_tokens(messages[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return messages[start:]
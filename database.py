@@ -1,12 +1,222 @@
 import os
+import json
+import time
+import atexit
+import random
 import pymysql
 import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
+from write_behind import MessageWriter
+from history_cache import HistoryCache
+from migrations import LATEST_VERSION, REBUILD_ROLLUPS_SQL, apply_pending, current_version
+from metrics import stage
 
 # Load environment variables
 load_dotenv()
 
+# Rows each analytics counter is spread over to avoid hot-row lock contention
+COUNTER_SLOTS = 16
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of database connections.
+
+    Connections are handed out most-recently-used first so the warmest ones
+    are reused, pinged on checkout once they have been idle longer than
+    ``health_check_interval`` and closed once idle longer than ``max_idle``
+    (never shrinking below ``min_size``).
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 max_idle=300.0, health_check_interval=5.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()  # (connection, last_used), oldest on the left
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "evicted": 0,
+            "failed_health_checks": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def fill(self):
+        """Open connections until the pool holds at least ``min_size``"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self):
+        """Check out a healthy connection, waiting up to ``timeout`` seconds"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            conn, last_used = self._checkout(deadline)
+            if conn is None:
+                # We reserved a slot for a brand new connection
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+                break
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                break
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+            self._discard(conn)
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if ``discard`` is set"""
+        if discard or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._evict_idle_locked()
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage and wait-time metrics"""
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": checkouts,
+                "created": self._stats["created"],
+                "discarded": self._stats["discarded"],
+                "evicted": self._stats["evicted"],
+                "failed_health_checks": self._stats["failed_health_checks"],
+                "timeouts": self._stats["timeouts"],
+                "wait_time_avg_ms": round(self._stats["wait_time_total"] / checkouts * 1000, 3) if checkouts else 0,
+                "wait_time_max_ms": round(self._stats["wait_time_max"] * 1000, 3),
+            }
+
+    def _checkout(self, deadline):
+        # Returns (connection, last_used) for an idle connection, or
+        # (None, None) once a slot for a new connection has been reserved
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                self._evict_idle_locked()
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["evicted"] += 1
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logging.warning(f"Pooled connection failed health check: {str(e)}")
+            return False
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._stats["discarded"] += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Default pool size, following the server's thread count. Queries are short, so
+# a quarter of the threads is plenty; keep it under MySQL's max_connections (151)
+def default_pool_size():
+    return max(10, int(os.getenv("SERVER_THREADS", "256")) // 4)
+
+
 class DatabaseManager:
     def __init__(self):
         self.host = os.getenv("DB_HOST", "localhost")
@@ -14,11 +224,84 @@ class DatabaseManager:
         self.password = os.getenv("DB_PASSWORD")
         self.database = os.getenv("DB_NAME", "mix_master_ai")
         
-        # Initialize database and tables
+        # Connection pool shared by every query
+        self.pool = ConnectionPool(
+            self.get_connection,
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", str(default_pool_size()))),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "5")),
+        )
+
+        # Apply pending schema migrations, then warm up the pool
         self._init_database()
+        try:
+            self.pool.fill()
+        except Exception as e:
+            logging.warning(f"Could not pre-open pooled connections: {str(e)}")
+
+        # Recent turns per session, kept in sync by save_message/clear_chat_history
+        self.history_cache = None
+        if os.getenv("HISTORY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"):
+            self.history_cache = HistoryCache(
+                max_sessions=int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "1000")),
+                ttl=float(os.getenv("HISTORY_CACHE_TTL", "300")),
+                max_bytes=int(float(os.getenv("HISTORY_CACHE_MAX_MB", "32")) * 1024 * 1024),
+            )
+
+        # Optional write-behind persistence of chat messages
+        self.writer = None
+        if os.getenv("DB_WRITE_BEHIND", "false").lower() in ("1", "true", "yes"):
+            self.writer = MessageWriter(
+                self._write_message_batch,
+                flush_interval=float(os.getenv("DB_FLUSH_INTERVAL", "0.5")),
+                batch_size=int(os.getenv("DB_FLUSH_BATCH_SIZE", "100")),
+                max_queue=int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000")),
+            )
+            atexit.register(self.close)
     
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the duration of a with-block"""
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # The connection is likely broken, don't hand it out again
+            self.pool.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.pool.release(conn)
+            raise
+        else:
+            self.pool.release(conn)
+
+    def get_pool_stats(self):
+        """Get connection pool metrics"""
+        return self.pool.stats()
+
+    def get_writer_stats(self):
+        """Get write-behind queue metrics, or None when disabled"""
+        return self.writer.stats() if self.writer else None
+
+    def get_history_cache_stats(self):
+        """Get chat history cache metrics, or None when disabled"""
+        return self.history_cache.stats() if self.history_cache else None
+
+    def close(self):
+        """Drain queued writes and close pooled connections"""
+        if self.writer:
+            self.writer.close()
+        self.pool.close()
+
+    def _flush_pending(self, session_id=None):
+        # Make queued writes visible before reading or deleting them
+        if self.writer and self.writer.has_pending(session_id):
+            self.writer.flush(timeout=self.pool.timeout)
+
     def get_connection(self):
-        """Get a database connection"""
+        """Open a new database connection (used by the pool)"""
         try:
             conn = pymysql.connect(
                 host=self.host,
@@ -35,9 +318,25 @@ class DatabaseManager:
             raise
     
     def _init_database(self):
-        """Initialize database and create tables if they don't exist"""
+        """Bring the database schema up to date.
+
+        The fast path is one version check on a pooled connection; the
+        migration lock is only taken when migrations are pending.
+        """
         try:
-            # First connect without specifying database to create it if needed
+            try:
+                with self.connection() as conn, conn.cursor() as cursor:
+                    version = current_version(cursor)
+            except pymysql.err.MySQLError as e:
+                # Unknown database (1049) or no schema_version table yet (1146)
+                if not e.args or e.args[0] not in (1049, 1146):
+                    raise
+                version = 0
+            if version >= LATEST_VERSION:
+                logging.info(f"Database schema is up to date (version {version})")
+                return
+            
+            # Connect without specifying database to create it if needed
             conn = pymysql.connect(
                 host=self.host,
                 user=self.user,
@@ -46,145 +345,264 @@ class DatabaseManager:
                 cursorclass=pymysql.cursors.DictCursor,
                 autocommit=True,
             )
-            
-            with conn.cursor() as cursor:
-                # Create database if it doesn't exist
-                cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.database}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-                cursor.execute(f"USE `{self.database}`")
-                
-                # Drop tables if they exist to avoid key conflicts, then recreate
-                cursor.execute("DROP TABLE IF EXISTS `chat_messages`")
-                cursor.execute("DROP TABLE IF EXISTS `sessions`")
-                
-                # Create sessions table for analytics
-                cursor.execute("""
-                    CREATE TABLE `sessions` (
-                        `id` int(11) NOT NULL AUTO_INCREMENT,
-                        `session_id` varchar(255) NOT NULL,
-                        `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        `last_activity` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        `message_count` int(11) DEFAULT 0,
-                        PRIMARY KEY (`id`),
-                        UNIQUE KEY `unique_session_id` (`session_id`)
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """)
-                
-                # Create chat_messages table
-                cursor.execute("""
-                    CREATE TABLE `chat_messages` (
-                        `id` int(11) NOT NULL AUTO_INCREMENT,
-                        `session_id` varchar(255) NOT NULL,
-                        `message_type` enum('user','assistant') NOT NULL,
-                        `content` text NOT NULL,
-                        `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        PRIMARY KEY (`id`),
-                        KEY `idx_session_id` (`session_id`),
-                        KEY `idx_timestamp` (`timestamp`)
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """)
-                
-            conn.close()
-            logging.info("Database and tables initialized successfully")
+            try:
+                with conn.cursor() as cursor:
+                    version = apply_pending(
+                        cursor,
+                        self.database,
+                        lock_timeout=int(os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "60")),
+                    )
+            finally:
+                conn.close()
+            logging.info(f"Database schema migrated to version {version}")
             
         except Exception as e:
             logging.error(f"Failed to initialize database: {str(e)}")
             # For development purposes, we'll continue without database
             logging.warning("Continuing without database - some features may not work")
+
+    def get_schema_version(self):
+        """Get the applied schema migration version"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            return current_version(cursor)
     
     def save_message(self, session_id, message_type, content):
         """Save a chat message to the database"""
+        if self.writer and self.writer.submit(session_id, message_type, content):
+            if self.history_cache:
+                self.history_cache.append(session_id, message_type, content)
+            return True
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                # Insert the message
-                cursor.execute(
-                    "INSERT INTO chat_messages (session_id, message_type, content) VALUES (%s, %s, %s)",
-                    (session_id, message_type, content)
-                )
-                
-                # Update or create session record
-                cursor.execute("""
-                    INSERT INTO sessions (session_id, message_count) 
-                    VALUES (%s, 1) 
-                    ON DUPLICATE KEY UPDATE 
-                    message_count = message_count + 1,
-                    last_activity = CURRENT_TIMESTAMP
-                """, (session_id,))
-                
-            conn.close()
+            with stage("db_write"), self.connection() as conn, conn.cursor() as cursor:
+                self._insert_messages(cursor, [(session_id, message_type, content)])
+            if self.history_cache:
+                self.history_cache.append(session_id, message_type, content)
             return True
         except Exception as e:
             logging.error(f"Failed to save message: {str(e)}")
             return False
     
+    def _write_message_batch(self, batch):
+        """Persist queued (session_id, message_type, content) rows in one transaction"""
+        with stage("db_write"), self.connection() as conn:
+            conn.begin()
+            try:
+                with conn.cursor() as cursor:
+                    self._insert_messages(cursor, batch)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _insert_messages(self, cursor, rows):
+        """Insert messages and update per-session and global rollups"""
+        per_session = {}
+        for session_id, message_type, _ in rows:
+            counts = per_session.setdefault(session_id, Counter())
+            counts[message_type] += 1
+
+        # pymysql rewrites these into multi-row INSERT statements
+        cursor.executemany(
+            "INSERT INTO chat_messages (session_id, message_type, content) VALUES (%s, %s, %s)",
+            rows
+        )
+        cursor.executemany("""
+            INSERT INTO sessions (session_id, message_count, user_messages, assistant_messages) 
+            VALUES (%s, %s, %s, %s) 
+            ON DUPLICATE KEY UPDATE 
+            message_count = message_count + VALUES(message_count),
+            user_messages = user_messages + VALUES(user_messages),
+            assistant_messages = assistant_messages + VALUES(assistant_messages),
+            last_activity = CURRENT_TIMESTAMP
+        """, [
+            (session_id, sum(counts.values()), counts["user"], counts["assistant"])
+            for session_id, counts in per_session.items()
+        ])
+        # An upsert reports 1 affected row per insert and 2 per update
+        new_sessions = 2 * len(per_session) - cursor.rowcount
+
+        by_type = Counter(message_type for _, message_type, _ in rows)
+        self._bump_counters(cursor, {
+            "total_sessions": new_sessions,
+            "total_messages": len(rows),
+            "messages_user": by_type["user"],
+            "messages_assistant": by_type["assistant"],
+        })
+
+    def _bump_counters(self, cursor, deltas):
+        """Add deltas to the analytics counters.
+
+        Each counter is spread over COUNTER_SLOTS rows and every write picks one
+        at random, so concurrent writers rarely wait on the same row lock.
+        """
+        slot = random.randrange(COUNTER_SLOTS)
+        rows = [(name, slot, delta) for name, delta in deltas.items() if delta]
+        if rows:
+            cursor.executemany("""
+                INSERT INTO analytics_counters (name, slot, value) 
+                VALUES (%s, %s, %s) 
+                ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+            """, rows)
+
+    def rebuild_rollups(self):
+        """Recompute session and analytics rollups from chat_messages"""
+        self._flush_pending()
+        with self.connection() as conn:
+            conn.begin()
+            try:
+                with conn.cursor() as cursor:
+                    for statement in REBUILD_ROLLUPS_SQL:
+                        cursor.execute(statement)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        logging.info("Analytics rollups rebuilt")
+
     def get_chat_history(self, session_id, limit=50):
-        """Retrieve chat history for a session"""
+        """Retrieve the last `limit` messages for a session, oldest first"""
+        return self.get_recent_messages(session_id, limit)
+
+    def get_recent_messages(self, session_id, limit=50, after_id=None, include_ids=False):
+        """Retrieve the last `limit` messages for a session, oldest first.
+
+        Seeks the (session_id, id) index backwards and reverses the rows, so the
+        cost depends on `limit` rather than on the session's length. With
+        `after_id`, returns up to `limit` messages newer than that id in
+        ascending order instead, for incremental fetches; pass
+        `include_ids=True` to get the ids needed for the next cursor.
+        """
+        use_cache = self.history_cache and after_id is None and not include_ids
+        if use_cache:
+            cached = self.history_cache.get(session_id, limit)
+            if cached is not None:
+                return cached
+            version = self.history_cache.version(session_id)
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT message_type as role, content 
-                    FROM chat_messages 
-                    WHERE session_id = %s 
-                    ORDER BY timestamp ASC 
-                    LIMIT %s
-                """, (session_id, limit))
-                
-                rows = cursor.fetchall()
-                # Convert tuples to list of dictionaries
-                messages = [{"role": row[0], "content": row[1]} for row in rows]
-            conn.close()
+            self._flush_pending(session_id)
+            with self.connection() as conn, conn.cursor() as cursor:
+                if after_id is None:
+                    cursor.execute("""
+                        SELECT id, message_type AS role, content 
+                        FROM chat_messages 
+                        WHERE session_id = %s 
+                        ORDER BY id DESC 
+                        LIMIT %s
+                    """, (session_id, limit))
+                    rows = list(reversed(cursor.fetchall()))
+                else:
+                    cursor.execute("""
+                        SELECT id, message_type AS role, content 
+                        FROM chat_messages 
+                        WHERE session_id = %s AND id > %s 
+                        ORDER BY id ASC 
+                        LIMIT %s
+                    """, (session_id, after_id, limit))
+                    rows = cursor.fetchall()
+
+            if include_ids:
+                messages = [{"id": row["id"], "role": row["role"], "content": row["content"]} for row in rows]
+            else:
+                messages = [{"role": row["role"], "content": row["content"]} for row in rows]
+            if use_cache:
+                # Fewer rows than the limit means we have the whole session
+                self.history_cache.put(session_id, messages, len(messages) < limit, version)
             return messages
         except Exception as e:
             logging.error(f"Failed to get chat history: {str(e)}")
             return []
     
+    def get_session_summary(self, session_id):
+        """Get the rolling conversation summary for a session"""
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT summary, last_message_id 
+                    FROM session_summaries 
+                    WHERE session_id = %s
+                """, (session_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logging.error(f"Failed to get session summary: {str(e)}")
+            return None
+
+    def save_session_summary(self, session_id, summary, last_message_id):
+        """Save a session's rolling summary covering messages up to last_message_id"""
+        try:
+            with stage("db_write"), self.connection() as conn, conn.cursor() as cursor:
+                # Only store it if the covered message still exists, so a summary
+                # computed while the session was being cleared is dropped
+                cursor.execute("""
+                    INSERT INTO session_summaries (session_id, summary, last_message_id) 
+                    SELECT %s, %s, %s FROM DUAL 
+                    WHERE EXISTS (SELECT 1 FROM chat_messages WHERE session_id = %s AND id = %s) 
+                    ON DUPLICATE KEY UPDATE 
+                    summary = VALUES(summary),
+                    last_message_id = VALUES(last_message_id)
+                """, (session_id, summary, last_message_id, session_id, last_message_id))
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save session summary: {str(e)}")
+            return False
+
     def clear_chat_history(self, session_id):
         """Clear chat history for a session"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            self._flush_pending(session_id)
+            with stage("db_write"), self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT message_count, user_messages, assistant_messages 
+                    FROM sessions 
+                    WHERE session_id = %s
+                """, (session_id,))
+                session = cursor.fetchone()
                 cursor.execute("DELETE FROM chat_messages WHERE session_id = %s", (session_id,))
                 cursor.execute("DELETE FROM sessions WHERE session_id = %s", (session_id,))
-            conn.close()
+                deleted_session = cursor.rowcount
+                cursor.execute("DELETE FROM session_summaries WHERE session_id = %s", (session_id,))
+                if session and deleted_session:
+                    self._bump_counters(cursor, {
+                        "total_sessions": -1,
+                        "total_messages": -session["message_count"],
+                        "messages_user": -session["user_messages"],
+                        "messages_assistant": -session["assistant_messages"],
+                    })
+            if self.history_cache:
+                self.history_cache.invalidate(session_id)
             return True
         except Exception as e:
             logging.error(f"Failed to clear chat history: {str(e)}")
             return False
     
     def get_analytics(self):
-        """Get overall usage analytics"""
+        """Get overall usage analytics from the rollup counters"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                # Total sessions
-                cursor.execute("SELECT COUNT(*) as total_sessions FROM sessions")
-                total_sessions = cursor.fetchone()['total_sessions']
-                
-                # Total messages
-                cursor.execute("SELECT COUNT(*) as total_messages FROM chat_messages")
-                total_messages = cursor.fetchone()['total_messages']
-                
-                # Messages by type
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT message_type, COUNT(*) as count 
-                    FROM chat_messages 
-                    GROUP BY message_type
+                    SELECT name, SUM(value) as value 
+                    FROM analytics_counters 
+                    GROUP BY name
                 """)
-                messages_by_type = {row['message_type']: row['count'] for row in cursor.fetchall()}
+                counters = {row['name']: int(row['value']) for row in cursor.fetchall()}
                 
-                # Active sessions (last 24 hours)
+                # Active sessions (last 24 hours), a range scan on idx_last_activity
                 cursor.execute("""
                     SELECT COUNT(*) as active_sessions 
                     FROM sessions 
                     WHERE last_activity >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
                 """)
                 active_sessions = cursor.fetchone()['active_sessions']
-                
-                # Average messages per session
-                avg_messages = total_messages / total_sessions if total_sessions > 0 else 0
-                
-            conn.close()
+            
+            total_sessions = counters.get('total_sessions', 0)
+            total_messages = counters.get('total_messages', 0)
+            messages_by_type = {
+                message_type: counters[f'messages_{message_type}']
+                for message_type in ('user', 'assistant')
+                if counters.get(f'messages_{message_type}')
+            }
+            
+            # Average messages per session
+            avg_messages = total_messages / total_sessions if total_sessions > 0 else 0
             
             return {
                 'total_sessions': total_sessions,
@@ -206,29 +624,24 @@ class DatabaseManager:
     def get_session_stats(self, session_id):
         """Get statistics for a specific session"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                # Session info
+            self._flush_pending(session_id)
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT session_id, created_at, last_activity, message_count 
+                    SELECT session_id, created_at, last_activity, message_count, 
+                           user_messages, assistant_messages 
                     FROM sessions 
                     WHERE session_id = %s
                 """, (session_id,))
                 session = cursor.fetchone()
                 
-                if not session:
-                    return None
-                
-                # Message breakdown
-                cursor.execute("""
-                    SELECT message_type, COUNT(*) as count 
-                    FROM chat_messages 
-                    WHERE session_id = %s 
-                    GROUP BY message_type
-                """, (session_id,))
-                message_breakdown = {row['message_type']: row['count'] for row in cursor.fetchall()}
-                
-            conn.close()
+            if not session:
+                return None
+            
+            message_breakdown = {
+                message_type: session[f'{message_type}_messages']
+                for message_type in ('user', 'assistant')
+                if session[f'{message_type}_messages']
+            }
             
             return {
                 'session_id': session['session_id'],
@@ -243,3 +656,19 @@ class DatabaseManager:
 
 # Create global instance
 db_manager = DatabaseManager()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mix Master database maintenance")
+    parser.add_argument("command", choices=["migrate", "backfill-rollups"])
+    args = parser.parse_args()
+
+    # Pending migrations were applied when db_manager was created
+    if args.command == "migrate":
+        print(f"Schema version: {db_manager.get_schema_version()} (latest {LATEST_VERSION})")
+
+    if args.command == "backfill-rollups":
+        db_manager.rebuild_rollups()
+        print(json.dumps(db_manager.get_analytics(), indent=2))
@@ -1,14 +1,23 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+import time
+import threading
 from dotenv import load_dotenv
-from openai import OpenAI
+from readiness import create_prober
+from clients import get_openai_client
+from llm_scheduler import STANDARD, chat_completion
+from singleflight import group
+from metrics import instrument, stage
+from cache_store import make_cache
+from normalize import canonicalize_location, canonicalize_mood, canonicalize_weather
 import logging
 import json
 
 # Initialize Flask app and CORS
 app = Flask(__name__)
 CORS(app)
+instrument(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,15 +33,24 @@ if not openai_api_key:
     raise ValueError("OpenAI API key not found")
 
 # Initialize OpenAI client
-client = OpenAI(api_key=openai_api_key)
-
-# Test OpenAI API connection
-try:
-    test_response = client.models.list()
-    logger.info("OpenAI API connection successful")
-except Exception as e:
-    logger.error(f"OpenAI API connection failed: {str(e)}")
-    raise ValueError("OpenAI API connection failed")
+client = get_openai_client()
+
+# Upstream checks run in the background so startup never waits on the network
+readiness = create_prober(client, checks=("openai",))
+
+# Recommendations per (mood, weather, location) bucket. Up to
+# RECOMMENDATION_VARIANTS answers are kept per bucket and served in rotation.
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "86400"))
+RECOMMENDATION_VARIANTS = int(os.getenv("RECOMMENDATION_VARIANTS", "3"))
+recommendation_cache = make_cache(
+    "recommendations",
+    max_entries=int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "2000")),
+    backend=os.getenv("RECOMMENDATION_CACHE_BACKEND"),
+)
+cache_stats = {"hits": 0, "misses": 0}
+cache_stats_lock = threading.Lock()
+rotation = 0
+recommendation_flight = group("recommendations")
 
 
 # Helper function to validate input
@@ -75,7 +93,8 @@ The drink should reflect the local culture or ingredients of {location}. Return
 Only return the JSON object. Do not include markdown or explanations.
 """
     try:
-        response = client.chat.completions.create(
+        response = chat_completion(
+            STANDARD,
             model="gpt-4o",
             messages=[
                 {
@@ -105,10 +124,59 @@ Only return the JSON object. Do not include markdown or explanations.
         return None
 
 
+# Helper function to map a request onto its cache bucket
+def recommendation_bucket(mood, weather, location):
+    return (
+        canonicalize_mood(mood),
+        canonicalize_weather(weather),
+        canonicalize_location(location),
+    )
+
+
+def count_cache(outcome):
+    with cache_stats_lock:
+        cache_stats[outcome] += 1
+
+
+# Helper function to generate a recommendation and add it to its bucket's variants
+def add_variant(key, bucket, variants):
+    recommendation = generate_recommendation(*bucket)
+    if recommendation:
+        recommendation_cache.set(key, variants + [recommendation])
+    return recommendation
+
+
+# Helper function to serve a cached variant, generating one if the bucket has room
+def get_recommendation(mood, weather, location):
+    global rotation
+    bucket = recommendation_bucket(mood, weather, location)
+    key = "|".join(bucket)
+
+    entry = recommendation_cache.get(key)
+    variants = []
+    if entry is not None and time.time() - entry[1] < RECOMMENDATION_CACHE_TTL:
+        variants = entry[0]
+    if len(variants) >= RECOMMENDATION_VARIANTS:
+        count_cache("hits")
+        with cache_stats_lock:
+            rotation += 1
+            index = rotation % len(variants)
+        return variants[index]
+
+    count_cache("misses")
+    # Concurrent misses for a bucket share one generated variant
+    recommendation = recommendation_flight.do(key, add_variant, key, bucket, variants)
+    if not recommendation and variants:
+        # Generation failed, but an earlier variant is still good to serve
+        return variants[-1]
+    return recommendation
+
+
 @app.route("/api/drink_recommend", methods=["POST"])
 def recommend():
     try:
-        data = request.get_json()
+        with stage("parse"):
+            data = request.get_json()
         if not data:
             return jsonify({"error": "Invalid JSON data"}), 400
 
@@ -125,7 +193,7 @@ def recommend():
         )
 
         # Generate recommendation
-        recommendation = generate_recommendation(mood, weather, location)
+        recommendation = get_recommendation(mood, weather, location)
         if not recommendation:
             return jsonify({"error": "Failed to generate recommendation"}), 500
 
@@ -143,5 +211,23 @@ def recommend():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/api/drink_recommend/stats", methods=["GET"])
+def recommendation_stats():
+    with cache_stats_lock:
+        stats = dict(cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["entries"] = len(recommendation_cache)
+    stats["variants_per_bucket"] = RECOMMENDATION_VARIANTS
+    stats["coalesced"] = recommendation_flight.stats()["coalesced"]
+    return jsonify(stats)
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -1,43 +1,91 @@
 import os
 import json
-import requests
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_scheduler import BACKGROUND, STANDARD, chat_completion
+from cache_store import make_cache
+from normalize import canonicalize_location
+from search_cache import search_cache
+from singleflight import group
+from metrics import instrument
 
 # --- Setup ---
 app = Flask(__name__)
+instrument(app)
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+# Per-lookup timeout for Serper, and the overall time budget of /api/get-brands
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "5"))
+BRANDS_DEADLINE = float(os.getenv("BRANDS_DEADLINE", "20"))
+
+# Shared pool for concurrent brand image lookups
+image_lookup_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BRAND_IMAGE_WORKERS", "16")),
+    thread_name_prefix="brand-image",
+)
+
+# Brand lists per canonical location. Entries younger than BRANDS_CACHE_TTL are
+# served as-is; older ones are served for up to BRANDS_CACHE_MAX_STALE more
+# seconds while a background refresh replaces them.
+BRANDS_CACHE_TTL = float(os.getenv("BRANDS_CACHE_TTL", "86400"))
+BRANDS_CACHE_MAX_STALE = float(os.getenv("BRANDS_CACHE_MAX_STALE", "604800"))
+# Lists with brand image lookups that failed or missed the deadline are only fresh this long
+BRANDS_PARTIAL_CACHE_TTL = float(os.getenv("BRANDS_PARTIAL_CACHE_TTL", "300"))
+brand_cache = make_cache(
+    "brands",
+    max_entries=int(os.getenv("BRANDS_CACHE_MAX_ENTRIES", "5000")),
+    backend=os.getenv("BRANDS_CACHE_BACKEND"),
+)
+brand_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="brand-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+# Concurrent misses for one location share a single OpenAI + Serper round
+brand_flight = group("brands")
 
 
 # --- Serper Image Fetcher ---
 def fetch_image_url(query):
     try:
-        headers = {
-            "X-API-KEY": SERPER_API_KEY,
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "q": f"{query} alcohol bottle site:drizly.com OR site:totalwine.com",
-            "type": "images",
-        }
-
-        response = requests.post(
-            "https://google.serper.dev/images", headers=headers, json=payload
+        results = search_cache.search(
+            "images",
+            f"{query} alcohol bottle site:drizly.com OR site:totalwine.com",
+            timeout=SERPER_TIMEOUT,
         )
-        results = response.json()
         return results.get("images", [{}])[0].get("imageUrl", "")
     except Exception as e:
-        print(f"[ERROR] Serper image fetch failed: {e}")
-        return ""
+        # None marks a failed lookup, as opposed to "" for no image found
+        logging.warning(f"Serper image fetch failed: {str(e)}")
+        return None
+
+
+# --- Concurrent Image Lookups ---
+def fetch_image_urls(brand_names, timeout):
+    """Look up images for all brands at once; brands that failed or weren't done in time get None"""
+    # Each lookup runs in a copy of this context so its timings keep the request's endpoint
+    futures = {
+        name: image_lookup_pool.submit(contextvars.copy_context().run, fetch_image_url, name)
+        for name in set(brand_names)
+    }
+    done, not_done = wait(futures.values(), timeout=max(0.0, timeout))
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        logging.warning(f"{len(not_done)} brand image lookups missed the deadline")
+    return {
+        name: future.result() if future in done else None
+        for name, future in futures.items()
+    }
 
 
 # --- Brand Generator ---
-def get_brands_from_openai(location: str) -> list:
+def get_brands_from_openai(location: str, priority=STANDARD) -> tuple:
+    """Return (brands, complete); complete is False if any image lookup failed or timed out"""
+    started = time.monotonic()
     prompt = f"""
 Based on the location "{location}", list 5-6 well-known alcohol brands that are popular and commonly available there.
 
@@ -66,7 +114,8 @@ Return strictly in this JSON format:
 """
 
     try:
-        chat_response = client.chat.completions.create(
+        chat_response = chat_completion(
+            priority,
             model="gpt-4o",
             messages=[
                 {
@@ -81,16 +130,68 @@ Return strictly in this JSON format:
         json_data = raw.replace("```json", "").replace("```", "").strip()
         brand_list = json.loads(json_data)
 
-        # Add image URLs using Serper
+        # Add image URLs using Serper, within what is left of the deadline
+        image_urls = fetch_image_urls(
+            [brand.get("brand_name", "") for brand in brand_list],
+            BRANDS_DEADLINE - (time.monotonic() - started),
+        )
         for brand in brand_list:
-            brand_name = brand.get("brand_name", "")
-            brand["image_url"] = fetch_image_url(brand_name)
+            brand["image_url"] = image_urls[brand.get("brand_name", "")] or ""
 
-        return brand_list
+        return brand_list, None not in image_urls.values()
 
     except Exception as e:
         print(f"[ERROR] OpenAI/JSON error: {e}")
-        return []
+        return [], False
+
+
+# --- Brand Cache (stale-while-revalidate) ---
+def fetch_and_store_brands(key, location, priority=STANDARD):
+    brands, complete = get_brands_from_openai(location, priority)
+    if brands:
+        stored_at = time.time()
+        if not complete:
+            # Goes stale after BRANDS_PARTIAL_CACHE_TTL, so a refresh fills in the images
+            stored_at -= max(0.0, BRANDS_CACHE_TTL - BRANDS_PARTIAL_CACHE_TTL)
+        brand_cache.set(key, brands, stored_at=stored_at)
+    return brands
+
+
+def load_brands(key, location, priority=STANDARD):
+    return brand_flight.do(key, fetch_and_store_brands, key, location, priority)
+
+
+def refresh_brands(key, location):
+    try:
+        # Someone already has a (stale) answer, so let live requests go first
+        load_brands(key, location, BACKGROUND)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def schedule_brand_refresh(key, location):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    brand_refresh_pool.submit(refresh_brands, key, location)
+
+
+def get_brands_cached(location):
+    """Return (brands, cache_status) where status is HIT, STALE or MISS"""
+    key = canonicalize_location(location)
+    entry = brand_cache.get(key)
+    if entry is not None:
+        brands, stored_at = entry
+        age = time.time() - stored_at
+        if age < BRANDS_CACHE_TTL:
+            return brands, "HIT"
+        if age < BRANDS_CACHE_TTL + BRANDS_CACHE_MAX_STALE:
+            schedule_brand_refresh(key, location)
+            return brands, "STALE"
+
+    return load_brands(key, location), "MISS"
 
 
 # --- API Endpoint ---
@@ -101,12 +202,14 @@ def get_brands_api():
         return jsonify({"error": "Missing 'location' parameter"}), 400
 
     print(f"🔍 Requesting brands for location: {location}")
-    brands = get_brands_from_openai(location)
+    brands, cache_status = get_brands_cached(location)
 
     if not brands:
         return jsonify({"error": "Failed to fetch brand data"}), 500
 
-    return jsonify(brands)
+    response = jsonify(brands)
+    response.headers["X-Cache"] = cache_status
+    return response
 
 
 # --- Run App ---
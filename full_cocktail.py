@@ -1,26 +1,59 @@
 import os
-import openai
+import time
+import hashlib
+import logging
 import requests
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
+from llm_scheduler import STANDARD, chat_completion
+from cache_store import make_cache
+from normalize import canonical_text
+from search_cache import SearchCacheMiss, search_cache
+from singleflight import group
+from metrics import instrument, stage
+from upload_limits import limit_uploads
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Flask app
 app = Flask(__name__)
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+instrument(app)
+limit_uploads(app)
+
+# Finished /alcohol-info responses, keyed by brand and description
+ALCOHOL_INFO_CACHE_TTL = float(os.getenv("ALCOHOL_INFO_CACHE_TTL", "604800"))
+# Answers written while Serper was failing are only fresh this long
+ALCOHOL_INFO_PARTIAL_CACHE_TTL = float(os.getenv("ALCOHOL_INFO_PARTIAL_CACHE_TTL", "300"))
+alcohol_info_cache = make_cache(
+    "alcohol_info",
+    max_entries=int(os.getenv("ALCOHOL_INFO_CACHE_MAX_ENTRIES", "5000")),
+    backend=os.getenv("ALCOHOL_INFO_CACHE_BACKEND"),
+)
+alcohol_info_flight = group("alcohol_info")
+
+
+def brand_cache_prefix(brand_name):
+    return f"{canonical_text(brand_name)}|"
+
+
+def alcohol_info_key(brand_name, description):
+    digest = hashlib.sha256(" ".join(description.split()).encode("utf-8")).hexdigest()
+    return brand_cache_prefix(brand_name) + digest
 
 
 def search_serper(query):
-    url = "https://google.serper.dev/search"
-    headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
-    payload = {"q": query, "num": 3}
-    res = requests.post(url, json=payload, headers=headers)
-    return res.json()
+    """Return (results, ok); ok is False if Serper failed and there are no results"""
+    try:
+        return search_cache.search("search", query, {"num": 3}), True
+    except SearchCacheMiss as e:
+        # Offline mode: answer without web snippets
+        logging.info(str(e))
+        return {}, True
+    except requests.RequestException as e:
+        # Serper down or slow: answer without web snippets
+        logging.warning(f"Serper search failed: {str(e)}")
+        return {}, False
 
 
 def generate_prompt(brand_name, description, serper_data):
@@ -95,42 +128,80 @@ Now return only the formatted output in the exact structure above. Do not explai
 """
 
 
+def generate_alcohol_info(cache_key, brand_name, description):
+    # Step 1: Search for related info
+    serper_data, search_ok = search_serper(brand_name)
+
+    # Step 2: Construct the formatted prompt
+    prompt = generate_prompt(brand_name, description, serper_data)
+
+    # Step 3: Get OpenAI completion
+    response = chat_completion(
+        STANDARD,
+        model="gpt-4",
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a knowledgeable cocktail expert.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+        max_tokens=800,
+    )
+
+    result_text = response.choices[0].message.content.strip()
+    stored_at = time.time()
+    if not search_ok:
+        # Goes stale after ALCOHOL_INFO_PARTIAL_CACHE_TTL, so the next request searches again
+        stored_at -= max(0.0, ALCOHOL_INFO_CACHE_TTL - ALCOHOL_INFO_PARTIAL_CACHE_TTL)
+    alcohol_info_cache.set(cache_key, result_text, stored_at=stored_at)
+    return result_text
+
+
 @app.route("/alcohol-info", methods=["POST"])
 def alcohol_info():
     try:
-        brand_name = request.form.get("brand_name")
-        description = request.form.get("description")
-        image = request.files.get("image")  # Optional, not used in this version
+        with stage("parse"):
+            brand_name = request.form.get("brand_name")
+            description = request.form.get("description")
+            image = request.files.get("image")  # Optional, not used in this version
 
         if not brand_name or not description:
             return jsonify({"error": "brand_name and description are required."}), 400
 
-        # Step 1: Search for related info
-        serper_data = search_serper(brand_name)
-
-        # Step 2: Construct the formatted prompt
-        prompt = generate_prompt(brand_name, description, serper_data)
-
-        # Step 3: Get OpenAI completion
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a knowledgeable cocktail expert.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=800,
-        )
+        cache_key = alcohol_info_key(brand_name, description)
+        cached = alcohol_info_cache.get(cache_key)
+        if cached is not None and time.time() - cached[1] < ALCOHOL_INFO_CACHE_TTL:
+            response = jsonify({"result": cached[0]})
+            response.headers["X-Cache"] = "HIT"
+            return response
 
-        result_text = response.choices[0].message.content.strip()
-        return jsonify({"result": result_text})
+        # Identical requests already in flight wait for that result
+        result_text = alcohol_info_flight.do(
+            cache_key, generate_alcohol_info, cache_key, brand_name, description
+        )
+        response = jsonify({"result": result_text})
+        response.headers["X-Cache"] = "MISS"
+        return response
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/alcohol-info/cache", methods=["DELETE"])
+def invalidate_alcohol_info():
+    brand_name = request.args.get("brand_name") or request.form.get("brand_name")
+    if not brand_name:
+        return jsonify({"error": "brand_name is required."}), 400
+    removed = alcohol_info_cache.delete_prefix(brand_cache_prefix(brand_name))
+    return jsonify({"brand_name": brand_name, "invalidated": removed})
+
+
+@app.route("/search-cache/stats", methods=["GET"])
+def search_cache_stats():
+    return jsonify(search_cache.stats())
+
+
 if __name__ == "__main__":
     app.run(debug=True)
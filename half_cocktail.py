@@ -1,25 +1,30 @@
-import os
+import json
 import base64
-from flask import Flask, request, jsonify
+import hashlib
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_scheduler import BACKGROUND, STANDARD, chat_completion
+from image_pipeline import ImageProcessingError, preprocess_image
+from image_cache import dhash, image_analysis_cache
+from metrics import in_current_context, instrument, stage
+from recipe_jobs import RECIPE_JOB_MAX_ITEMS, RECIPE_JOB_MAX_UPLOAD_BYTES, create_recipe_jobs
+from upload_limits import limit_uploads
 
 # Load environment variables
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Initialize Flask app and enable CORS
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+instrument(app)
+limit_uploads(app, overrides={"/generate_recipe/jobs": RECIPE_JOB_MAX_UPLOAD_BYTES})
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
 
-
-# Helper: Encode image to base64
-def encode_image_to_base64(image_file):
-    return base64.b64encode(image_file.read()).decode("utf-8")
+# Helper: Encode image bytes to base64
+def encode_image_to_base64(image_bytes):
+    with stage("base64"):
+        return base64.b64encode(image_bytes).decode("utf-8")
 
 
 # Updated Prompt Template
@@ -86,6 +91,83 @@ Only output from “How to Make It” onward. Do not explain anything else.
 """
 
 
+# Collect ingredient lines from ingredient_N / quantity_N form fields
+def collect_ingredients(form):
+    ingredients = ""
+    for key in form:
+        if key.startswith("ingredient_"):
+            ing_name = form.get(key)
+            qty_key = key.replace("ingredient_", "quantity_")
+            qty = form.get(qty_key, "")
+            if ing_name:
+                ingredients += f"- {ing_name}: {qty} ml\n"
+    return ingredients
+
+
+# Fill the prompt from the recipe form (request.form or a plain dict)
+def build_recipe_prompt(form):
+    return INSTRUCTION_PROMPT.format(
+        name=form.get("name", ""),
+        category=form.get("category", ""),
+        alcohol_content=form.get("alcohol_content", ""),
+        drink_strength=form.get("drink_strength", ""),
+        glass_type=form.get("glass_type", ""),
+        servings=form.get("servings", ""),
+        ingredients=collect_ingredients(form).strip(),
+        description=form.get("description", ""),
+    )
+
+
+# Generate the recipe for a preprocessed image and filled prompt
+def generate_recipe(image_bytes, filled_prompt, priority=STANDARD):
+    # Reuse the recipe generated for a near-duplicate image with the same form
+    image_hash = None
+    cache_namespace = "recipe:" + hashlib.sha256(filled_prompt.encode("utf-8")).hexdigest()
+    if image_analysis_cache is not None:
+        image_hash = dhash(image_bytes)
+        cached = image_analysis_cache.get(image_hash, cache_namespace)
+        if cached is not None:
+            return cached
+
+    # Convert image to base64
+    base64_image = encode_image_to_base64(image_bytes)
+
+    # Call OpenAI API
+    response = chat_completion(
+        priority,
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": filled_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        },
+                    },
+                ],
+            }
+        ],
+        max_tokens=1000,
+    )
+
+    result = response.choices[0].message.content
+    if image_hash is not None and result:
+        image_analysis_cache.put(image_hash, cache_namespace, result)
+    return result
+
+
+# One batch item; batch work yields to interactive traffic in the scheduler
+def generate_batch_recipe(fields, image_bytes):
+    return generate_recipe(preprocess_image(image_bytes), build_recipe_prompt(fields), BACKGROUND)
+
+
+recipe_jobs = create_recipe_jobs(generate_batch_recipe)
+recipe_jobs.resume()
+
+
 # Endpoint
 @app.route("/generate_recipe", methods=["POST"])
 def upload_image():
@@ -97,65 +179,102 @@ def upload_image():
         return jsonify({"error": "No selected image."}), 400
 
     try:
-        # Get form data
-        name = request.form.get("name", "")
-        category = request.form.get("category", "")
-        alcohol_content = request.form.get("alcohol_content", "")
-        drink_strength = request.form.get("drink_strength", "")
-        glass_type = request.form.get("glass_type", "")
-        servings = request.form.get("servings", "")
-        description = request.form.get("description", "")
-
-        # Dynamically collect ingredients
-        ingredients = ""
-        for key in request.form:
-            if key.startswith("ingredient_"):
-                ing_name = request.form.get(key)
-                qty_key = key.replace("ingredient_", "quantity_")
-                qty = request.form.get(qty_key, "")
-                if ing_name:
-                    ingredients += f"- {ing_name}: {qty} ml\n"
-
-        # Prepare the dynamic prompt
-        filled_prompt = INSTRUCTION_PROMPT.format(
-            name=name,
-            category=category,
-            alcohol_content=alcohol_content,
-            drink_strength=drink_strength,
-            glass_type=glass_type,
-            servings=servings,
-            ingredients=ingredients.strip(),
-            description=description,
-        )
-
-        # Convert image to base64
-        base64_image = encode_image_to_base64(image_file)
-
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": filled_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=1000,
-        )
+        with stage("parse"):
+            # Get form data and prepare the dynamic prompt
+            filled_prompt = build_recipe_prompt(request.form)
+
+        # Downscale the image in memory
+        image_bytes = preprocess_image(image_file.read())
+
+        return jsonify({"recipe": generate_recipe(image_bytes, filled_prompt)})
 
-        result = response.choices[0].message.content
-        return jsonify({"recipe": result})
+    except ImageProcessingError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+
+# Read batch items from JSON ({"items": [{..., "image_base64": ...}]}) or
+# multipart (a "specs" JSON list whose "image" values name uploaded files)
+def parse_batch_items():
+    if request.is_json:
+        body = request.get_json(silent=True)
+        specs = body.get("items") if isinstance(body, dict) else None
+    else:
+        try:
+            specs = json.loads(request.form.get("specs") or "null")
+        except ValueError:
+            raise ValueError("'specs' must be a JSON list.")
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("Provide a non-empty list of recipe specs.")
+    if len(specs) > RECIPE_JOB_MAX_ITEMS:
+        raise ValueError(f"At most {RECIPE_JOB_MAX_ITEMS} items per job.")
+
+    items = []
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Item {i} must be an object.")
+        fields = {
+            key: str(value) for key, value in spec.items()
+            if key not in ("image", "image_base64") and value is not None
+        }
+        if spec.get("image_base64"):
+            data = spec["image_base64"]
+            if "," in data:
+                data = data.split(",")[1]
+            try:
+                image_bytes = base64.b64decode(data, validate=True)
+            except ValueError:
+                raise ValueError(f"Item {i} has invalid base64 image data.")
+        else:
+            image_file = request.files.get(spec.get("image") or "")
+            if image_file is None or image_file.filename == "":
+                raise ValueError(f"Item {i} has no image.")
+            image_bytes = image_file.read()
+        items.append((fields, image_bytes))
+    return items
+
+
+# Start a batch job; items already generated earlier are served from cache
+@app.route("/generate_recipe/jobs", methods=["POST"])
+def create_recipe_job():
+    try:
+        with stage("parse"):
+            items = parse_batch_items()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job = recipe_jobs.submit(items)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = f"/generate_recipe/jobs/{job['job_id']}"
+    return response
+
+
+# Job progress
+@app.route("/generate_recipe/jobs/<job_id>", methods=["GET"])
+def get_recipe_job(job_id):
+    job = recipe_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
+
+
+# Finished items as NDJSON, streamed as they complete unless ?follow=false
+@app.route("/generate_recipe/jobs/<job_id>/results", methods=["GET"])
+def get_recipe_job_results(job_id):
+    if recipe_jobs.status(job_id) is None:
+        return jsonify({"error": "Job not found."}), 404
+    follow = request.args.get("follow", "true").lower() in ("1", "true", "yes")
+    lines = (json.dumps(item) + "\n" for item in recipe_jobs.results(job_id, follow=follow))
+    return Response(
+        stream_with_context(in_current_context(lines)),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # Run app
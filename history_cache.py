@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Rough per-message bookkeeping overhead used for the memory estimate
+MESSAGE_OVERHEAD_BYTES = 120
+
+
+class _Entry:
+    __slots__ = ("messages", "complete", "expires_at", "size")
+
+    def __init__(self, messages, complete, expires_at):
+        self.messages = messages
+        self.complete = complete
+        self.expires_at = expires_at
+        self.size = sum(_message_size(m) for m in messages)
+
+
+def _message_size(message):
+    return len(message["content"]) + MESSAGE_OVERHEAD_BYTES
+
+
+class HistoryCache:
+    """In-memory LRU + TTL cache of the most recent chat turns per session.
+
+    Each entry keeps the session's last ``window`` messages, oldest first.
+    ``complete`` records whether those are the session's entire history; an
+    entry answers a query for the last ``limit`` messages when it is complete
+    or holds at least ``limit`` of them. Entries expire ``ttl`` seconds after
+    they were loaded so writes made by other processes show up eventually.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=300.0, max_bytes=32 * 1024 * 1024, window=50):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.window = window
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Striped write counters: a load is only stored if no write to the
+        # session happened while it was being read from the database
+        self._versions = [0] * 1024
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def version(self, session_id):
+        """Token to pass to ``put`` so stale loads are discarded"""
+        with self._lock:
+            return self._versions[self._slot(session_id)]
+
+    def get(self, session_id, limit):
+        """Return the last ``limit`` messages, or None on a miss"""
+        with self._lock:
+            entry = self._lookup(session_id)
+            if entry is None or (not entry.complete and len(entry.messages) < limit):
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return [dict(m) for m in entry.messages[-limit:]] if limit > 0 else []
+
+    def put(self, session_id, messages, complete, version):
+        """Store messages loaded from the database, oldest first"""
+        with self._lock:
+            if self._versions[self._slot(session_id)] != version:
+                return
+            self._remove(session_id)
+            if len(messages) > self.window:
+                messages = messages[-self.window:]
+                complete = False
+            entry = _Entry([dict(m) for m in messages], complete, time.monotonic() + self.ttl)
+            self._entries[session_id] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def append(self, session_id, role, content):
+        """Record a newly saved message for a cached session"""
+        with self._lock:
+            self._versions[self._slot(session_id)] += 1
+            entry = self._lookup(session_id)
+            if entry is None:
+                return
+            message = {"role": role, "content": content}
+            entry.messages.append(message)
+            entry.size += _message_size(message)
+            self._bytes += _message_size(message)
+            if len(entry.messages) > self.window:
+                dropped = entry.messages.pop(0)
+                entry.size -= _message_size(dropped)
+                self._bytes -= _message_size(dropped)
+                entry.complete = False
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def invalidate(self, session_id):
+        """Forget a session's cached history"""
+        with self._lock:
+            self._versions[self._slot(session_id)] += 1
+            self._remove(session_id)
+
+    def stats(self):
+        """Return hit/miss counters and memory usage"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                sessions=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0,
+            )
+
+    def _slot(self, session_id):
+        return hash(session_id) % len(self._versions)
+
+    def _lookup(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(session_id)
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def _remove(self, session_id):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats["evictions"] += 1
@@ -0,0 +1,121 @@
+import io
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def dhash(image_bytes, hash_size=8):
+    """Return the 64-bit difference hash of an image as an int.
+
+    Each bit records whether a pixel is brighter than its right-hand
+    neighbour in a tiny grayscale thumbnail, so re-encodes, resizes and small
+    lighting changes of the same photo hash to nearby values.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == "JPEG":
+        image.draft("L", (hash_size * 8, hash_size * 8))
+    pixels = list(
+        image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata()
+    )
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class PerceptualHashCache:
+    """LRU + TTL cache that returns results stored for near-duplicate images.
+
+    Entries are keyed by ``(namespace, dhash)``; a lookup matches the closest
+    unexpired entry in the same namespace whose hash is within
+    ``max_distance`` bits. Namespaces keep results for different prompts apart.
+    """
+
+    def __init__(self, max_distance=6, ttl=86400.0, max_entries=1024, min_hash_bits=5):
+        self.max_distance = max_distance
+        self.min_hash_bits = min_hash_bits
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (namespace, hash) -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "low_detail": 0}
+
+    def is_distinctive(self, image_hash):
+        # Uniform or low-texture images hash to (nearly) all zeros or all ones,
+        # so they would all look like near duplicates of each other
+        bits = bin(image_hash).count("1")
+        return self.min_hash_bits <= bits <= 64 - self.min_hash_bits
+
+    def get(self, image_hash, namespace=""):
+        """Return the stored value for a near-duplicate image, or None"""
+        now = time.monotonic()
+        with self._lock:
+            if not self.is_distinctive(image_hash):
+                self._stats["low_detail"] += 1
+                return None
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (_, expires_at) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[key]
+                    continue
+                if key[0] != namespace:
+                    continue
+                distance = hamming_distance(key[1], image_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            if best_distance:
+                self._stats["near_hits"] += 1
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][0]
+
+    def put(self, image_hash, namespace, value):
+        """Store a result for an image; low-detail images are not cached"""
+        if not self.is_distinctive(image_hash):
+            return
+        with self._lock:
+            key = (namespace, image_hash)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0,
+            )
+
+
+# Shared cache for vision results, used by chatbot and half_cocktail
+image_analysis_cache = None
+if os.getenv("IMAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"):
+    image_analysis_cache = PerceptualHashCache(
+        max_distance=int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "6")),
+        ttl=float(os.getenv("IMAGE_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "1024")),
+        min_hash_bits=int(os.getenv("IMAGE_CACHE_MIN_HASH_BITS", "5")),
+    )
+    logging.info("Perceptual-hash image analysis cache enabled")
@@ -0,0 +1,148 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+
+# Vision analyses running at once for async requests
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "8"))
+# Jobs queued or running before new ones are refused
+IMAGE_JOB_MAX_PENDING = int(os.getenv("IMAGE_JOB_MAX_PENDING", "200"))
+# Seconds a finished job's result stays available for polling
+IMAGE_JOB_TTL = int(os.getenv("IMAGE_JOB_TTL", "600"))
+# Longest a long-poll may wait for a result
+IMAGE_JOB_MAX_WAIT = float(os.getenv("IMAGE_JOB_MAX_WAIT", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ImageJobsFull(Exception):
+    """Raised when IMAGE_JOB_MAX_PENDING jobs are already queued or running"""
+
+
+class _Job:
+    __slots__ = ("job_id", "session_id", "status", "result", "error", "created_at", "finished_at", "done")
+
+    def __init__(self, job_id, session_id):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+
+class ImageJobs:
+    """Runs image analyses on a background pool and keeps their results for polling.
+
+    ``submit`` returns at once with a job ID; the analysis (which also saves
+    the turn to the session history) runs on one of ``workers`` threads in a
+    copy of the submitting request's context, so metrics and log lines keep
+    its endpoint and request ID. Finished jobs are kept for ``ttl`` seconds.
+    """
+
+    def __init__(self, workers=8, max_pending=200, ttl=600):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-job")
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, fn, *args):
+        """Queue ``fn(*args)``, whose return value becomes the job's result"""
+        job = _Job(uuid.uuid4().hex, session_id)
+        with self._lock:
+            self._purge()
+            if self._pending >= self.max_pending:
+                raise ImageJobsFull(f"{self._pending} image analyses are already pending")
+            self._pending += 1
+            self._jobs[job.job_id] = job
+        self.pool.submit(contextvars.copy_context().run, self._run, job, fn, args)
+        return self._snapshot(job)
+
+    def _run(self, job, fn, args):
+        job.status = RUNNING
+        try:
+            job.result = fn(*args)
+            job.status = DONE
+        except Exception as e:
+            logging.error(f"Image job {job.job_id} failed: {str(e)}")
+            job.error = str(e) or type(e).__name__
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+            job.done.set()
+
+    def get(self, job_id, wait=0):
+        """Snapshot of a job, waiting up to ``wait`` seconds for it to finish; None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if wait > 0:
+            job.done.wait(wait)
+        return self._snapshot(job)
+
+    @staticmethod
+    def _snapshot(job):
+        snapshot = {
+            "job_id": job.job_id,
+            "session_id": job.session_id,
+            "status": job.status,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+        if job.status == DONE:
+            snapshot["result"] = job.result
+        elif job.status == FAILED:
+            snapshot["error"] = job.error
+        return snapshot
+
+    def _purge(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+
+image_jobs = ImageJobs(
+    workers=IMAGE_JOB_WORKERS,
+    max_pending=IMAGE_JOB_MAX_PENDING,
+    ttl=IMAGE_JOB_TTL,
+)
+
+
+def _collect_metrics():
+    counts = image_jobs.stats()
+    return [
+        ("mixmaster_image_jobs", "gauge", "Async image analysis jobs held, by status",
+         [({"status": status}, count) for status, count in counts.items()]),
+    ]
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,185 @@
+import io
+import os
+import re
+import base64
+import logging
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from metrics import stage
+
+load_dotenv()
+
+# Longest edge and JPEG quality of the images we send to the vision models
+MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# JPEG/PNG uploads at most this large (and within MAX_EDGE) are sent to OpenAI unchanged
+PASSTHROUGH_MAX_BYTES = int(os.getenv("IMAGE_PASSTHROUGH_MAX_BYTES", str(1536 * 1024)))
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+# Base64 characters decoded to read an upload's header (format, size, EXIF)
+SNIFF_CHARS = 64 * 1024
+BASE64_PAYLOAD = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
+# Magic bytes of the formats we accept, checked before handing data to Pillow
+SIGNATURES = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+]
+
+
+class ImageProcessingError(ValueError):
+    """Raised when uploaded bytes are not an image we can process"""
+
+
+def sniff_format(data):
+    """Return the Pillow format name for the image bytes, or None"""
+    for signature, image_format in SIGNATURES:
+        if data.startswith(signature):
+            return image_format
+    if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def preprocess_image(data, max_edge=None, quality=None):
+    """Normalize uploaded image bytes into a compact JPEG, entirely in memory.
+
+    JPEGs are decoded at a reduced scale via Pillow's draft mode, EXIF
+    orientation is applied, the image is downscaled so its longest edge is at
+    most ``max_edge`` and re-encoded at ``quality``.
+    """
+    with stage("image_preprocess"):
+        max_edge = max_edge or MAX_EDGE
+        quality = quality or JPEG_QUALITY
+
+        image_format = sniff_format(data)
+        if image_format is None:
+            raise ImageProcessingError("Unsupported or unrecognized image format")
+
+        try:
+            image = Image.open(io.BytesIO(data), formats=[image_format])
+            original_size = image.size
+            if image_format == "JPEG":
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers max_edge
+                image.draft("RGB", (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                # Flatten transparency onto white rather than the default black
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageProcessingError(f"Could not decode image: {str(e)}") from e
+
+        processed = output.getvalue()
+        logging.info(
+            f"Image preprocessed: {image_format} {original_size[0]}x{original_size[1]} "
+            f"({len(data)} bytes) -> JPEG {image.size[0]}x{image.size[1]} ({len(processed)} bytes)"
+        )
+        return processed
+
+
+class VisionImage:
+    """An image bound for a vision model, held as raw bytes and/or base64.
+
+    Preprocessed images start as bytes and are encoded on first use. Client
+    payloads that pass through start as base64 and are only decoded if the
+    bytes are needed, e.g. for the perceptual hash.
+    """
+
+    __slots__ = ("mime", "_raw", "_b64", "_data_url")
+
+    def __init__(self, raw=None, b64=None, mime="image/jpeg", data_url=None):
+        self.mime = mime
+        self._raw = raw
+        self._b64 = b64
+        self._data_url = data_url
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = base64.b64decode(self._b64 if self._b64 is not None else self._data_url.partition(",")[2])
+        return self._raw
+
+    def data_url(self):
+        if self._data_url is None:
+            if self._b64 is None:
+                with stage("base64"):
+                    self._b64 = base64.b64encode(self._raw).decode("ascii")
+            self._data_url = f"data:{self.mime};base64,{self._b64}"
+            # The URL now holds the only copy we need of the base64 text
+            self._b64 = None
+        return self._data_url
+
+
+def _passthrough_format(head, size):
+    # The MIME type to send an upload as-is with, or None if it needs preprocessing
+    image_format = sniff_format(head)
+    if image_format not in PASSTHROUGH_FORMATS or size > PASSTHROUGH_MAX_BYTES:
+        return None
+    try:
+        # Only the header is parsed, so a truncated head is enough
+        image = Image.open(io.BytesIO(head), formats=[image_format])
+        if max(image.size) > MAX_EDGE or image.getexif().get(0x0112, 1) != 1:
+            return None
+        if image.mode not in ("RGB", "L", "RGBA", "LA", "P"):
+            return None
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+    return PASSTHROUGH_FORMATS[image_format]
+
+
+def prepare_image(data):
+    """VisionImage for uploaded bytes, skipping preprocessing when they are already acceptable"""
+    mime = _passthrough_format(data[:SNIFF_CHARS], len(data))
+    if mime is not None:
+        logging.info(f"Image passed through: {mime} ({len(data)} bytes)")
+        return VisionImage(raw=data, mime=mime)
+    return VisionImage(raw=preprocess_image(data))
+
+
+def prepare_base64_image(payload):
+    """VisionImage for a base64 string or data URL, without decoding it when possible.
+
+    Only a prefix is decoded to sniff the format and header. Acceptable JPEG
+    and PNG payloads are forwarded as the client sent them; anything else is
+    decoded and preprocessed.
+    """
+    prefix, comma, b64 = payload.partition(",")
+    if not comma:
+        b64 = payload
+    mime = None
+    with stage("base64"):
+        try:
+            head = base64.b64decode(b64[:SNIFF_CHARS])
+        except ValueError:
+            # Whitespace or other noise; left to the full decode below
+            head = None
+    if head is not None:
+        if sniff_format(head) is None:
+            raise ImageProcessingError("Unsupported or unrecognized image format")
+        size = len(b64) * 3 // 4 - (2 if b64.endswith("==") else 1 if b64.endswith("=") else 0)
+        mime = _passthrough_format(head, size)
+    if mime is not None and BASE64_PAYLOAD.fullmatch(b64):
+        logging.info(f"Base64 image passed through: {mime} ({size} bytes)")
+        if comma and prefix == f"data:{mime};base64":
+            # Reuse the client's data URL as-is
+            return VisionImage(mime=mime, data_url=payload)
+        return VisionImage(b64=b64, mime=mime)
+
+    with stage("base64"):
+        try:
+            data = base64.b64decode(b64)
+        except ValueError as e:
+            raise ImageProcessingError(f"Invalid base64 image data: {str(e)}") from e
+    return VisionImage(raw=preprocess_image(data))
@@ -0,0 +1,239 @@
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+from collections import deque
+import openai
+from dotenv import load_dotenv
+from clients import get_openai_client
+from context_builder import message_tokens
+import metrics
+
+load_dotenv()
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"   # chat replies a user is waiting on
+STANDARD = "standard"         # other user-facing endpoints
+BACKGROUND = "background"     # summaries, batch jobs
+PRIORITIES = {INTERACTIVE: 0, STANDARD: 1, BACKGROUND: 2}
+
+# Completion tokens assumed for requests that don't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
+
+
+def _percentile_ms(sorted_seconds, q):
+    if not sorted_seconds:
+        return 0.0
+    index = min(len(sorted_seconds) - 1, int(len(sorted_seconds) * q))
+    return round(sorted_seconds[index] * 1000, 1)
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waits in the queue longer than the queue timeout"""
+
+
+class TokenBucket:
+    """Refills ``rate`` units per second up to ``capacity``; may go negative on refunds"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Seconds until ``amount`` units are available
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class LLMScheduler:
+    """Admits chat completions under RPM/TPM limits, most urgent priority first.
+
+    Every call waits in a priority queue until both the request bucket and
+    the token bucket can cover it. Tokens are estimated from the messages plus
+    ``max_tokens``. Once a response arrives, the estimate is corrected with the
+    reported usage. Rate-limit, 5xx and connection errors are retried with
+    jittered exponential backoff, and each retry is queued again.
+    """
+
+    def __init__(self, rpm=500, tpm=200000, max_retries=4, base_delay=0.5, max_delay=20.0,
+                 queue_timeout=60.0, client_factory=get_openai_client):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self.client_factory = client_factory
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {
+            name: {"submitted": 0, "completed": 0, "failed": 0, "retries": 0, "timeouts": 0}
+            for name in PRIORITIES
+        }
+        self._waits = {name: deque(maxlen=1000) for name in PRIORITIES}
+
+    def create(self, priority=STANDARD, **kwargs):
+        """Scheduled ``client.chat.completions.create``"""
+        estimate = self.estimate_tokens(kwargs)
+        self._count(priority, "submitted")
+        attempt = 0
+        while True:
+            with metrics.stage("openai_queue"):
+                self._acquire(priority, estimate)
+            try:
+                with metrics.stage("openai"):
+                    response = self.client_factory().chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    self._count(priority, "failed")
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self._count(priority, "retries")
+                logging.warning(
+                    f"OpenAI call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._count(priority, "failed")
+                raise
+            self._count(priority, "completed")
+            self._settle(estimate, response)
+            return response
+
+    @staticmethod
+    def estimate_tokens(kwargs):
+        prompt = sum(message_tokens(m) for m in kwargs.get("messages", []))
+        return prompt + (kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+    def _acquire(self, priority, estimate):
+        entry = (PRIORITIES[priority], next(self._seq))
+        queued_at = time.monotonic()
+        deadline = queued_at + self.queue_timeout
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] == entry:
+                        self.requests.refill(now)
+                        self.tokens.refill(now)
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimate))
+                        if wait == 0:
+                            self.requests.take(1)
+                            self.tokens.take(estimate)
+                            break
+                    else:
+                        # Woken when the queue head changes
+                        wait = None
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._count(priority, "timeouts")
+                        raise SchedulerTimeout(
+                            f"OpenAI request waited over {self.queue_timeout}s in the {priority} queue"
+                        )
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+            self._waits[priority].append(time.monotonic() - queued_at)
+
+    def _settle(self, estimate, response):
+        # Replace the estimate with what the call actually used
+        usage = getattr(response, "usage", None)
+        metrics.record_usage(getattr(response, "model", None), usage)
+        total = getattr(usage, "total_tokens", None)
+        if isinstance(total, int):
+            with self._cond:
+                self.tokens.take(total - estimate)
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        # Full jitter keeps retries from a burst from landing together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _count(self, priority, name):
+        with self._cond:
+            self._stats[priority][name] += 1
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in PRIORITIES}
+            names = {rank: name for name, rank in PRIORITIES.items()}
+            for rank, _ in self._queue:
+                depth[names[rank]] += 1
+            result = {}
+            for name, counts in self._stats.items():
+                waits = sorted(self._waits[name])
+                result[name] = {
+                    **counts,
+                    "queue_depth": depth[name],
+                    "wait_p50_ms": _percentile_ms(waits, 0.5),
+                    "wait_p95_ms": _percentile_ms(waits, 0.95),
+                    "wait_max_ms": _percentile_ms(waits, 1.0),
+                }
+            self.requests.refill(time.monotonic())
+            self.tokens.refill(time.monotonic())
+            result["limits"] = {
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+            }
+            return result
+
+
+scheduler = LLMScheduler(
+    rpm=int(os.getenv("OPENAI_RPM_LIMIT", "500")),
+    tpm=int(os.getenv("OPENAI_TPM_LIMIT", "200000")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+    base_delay=float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20")),
+    queue_timeout=float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60")),
+)
+
+
+def chat_completion(priority=STANDARD, **kwargs):
+    """Send a chat completion through the shared scheduler"""
+    return scheduler.create(priority, **kwargs)
+
+
+def _collect_metrics():
+    current = scheduler.stats()
+    return [
+        ("mixmaster_llm_queue_depth", "gauge", "OpenAI requests waiting for admission",
+         [({"priority": name}, current[name]["queue_depth"]) for name in PRIORITIES]),
+        ("mixmaster_llm_requests_total", "counter", "OpenAI requests by priority and outcome",
+         [({"priority": name, "outcome": outcome}, current[name][outcome])
+          for name in PRIORITIES for outcome in ("completed", "failed", "retries", "timeouts")]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
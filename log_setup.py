@@ -0,0 +1,176 @@
+import os
+import sys
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_FILE = os.getenv("LOG_FILE")
+# Records waiting for the writer thread; further records are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Share of records below LOG_SAMPLE_BELOW that are kept; WARNING and above always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_SAMPLE_BELOW = os.getenv("LOG_SAMPLE_BELOW", "INFO").upper()
+LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(request_id)s %(session_id)s] %(message)s"
+
+request_id = contextvars.ContextVar("request_id", default="-")
+session_id = contextvars.ContextVar("session_id", default="-")
+
+_stats = {"dropped": 0, "sampled_out": 0}
+_stats_lock = threading.Lock()
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the request and session IDs of the calling context"""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        record.session_id = session_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every record at or above ``level`` and a ``rate`` share of the rest"""
+
+    def __init__(self, rate, level):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno >= self.level or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            return True
+        _count("sampled_out")
+        return False
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Hands records to the writer thread without formatting them first.
+
+    The stock QueueHandler renders the message on the calling thread. Here
+    %-style arguments are left on the record, so interpolation and I/O both
+    happen on the writer thread.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks reference live frames, so render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+
+def setup_logging():
+    """Route the root logger through a queue drained by a background writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = logging.getLevelName(LOG_LEVEL)
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if LOG_FILE:
+            handlers.append(logging.FileHandler(LOG_FILE))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = BackgroundQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE, logging.getLevelName(LOG_SAMPLE_BELOW)))
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def bind_session(value):
+    """Tag later log lines from this request with a session ID"""
+    session_id.set(value or "-")
+
+
+def attach_request_ids(app):
+    """Give every request of a Flask app an ID (X-Request-ID if sent) for its log lines"""
+
+    @app.before_request
+    def _bind_request_id():
+        value = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+        g.log_tokens = (request_id.set(value), session_id.set("-"))
+
+    @app.after_request
+    def _echo_request_id(response):
+        response.headers.setdefault("X-Request-ID", request_id.get())
+        return response
+
+    @app.teardown_request
+    def _unbind_request_id(exc=None):
+        for var, token in zip((request_id, session_id), g.pop("log_tokens", ())):
+            try:
+                var.reset(token)
+            except ValueError:
+                # Streamed responses may finish in a different context
+                pass
+
+    return app
+
+
+def stats():
+    with _stats_lock:
+        counts = dict(_stats)
+    counts["queued"] = _listener.queue.qsize() if _listener else 0
+    return counts
+
+
+def _collect_metrics():
+    current = stats()
+    return [
+        ("mixmaster_log_records_dropped_total", "counter", "Log records dropped because the queue was full",
+         [({}, current["dropped"])]),
+        ("mixmaster_log_records_sampled_out_total", "counter", "Low-level log records skipped by sampling",
+         [({}, current["sampled_out"])]),
+        ("mixmaster_log_queue_depth", "gauge", "Log records waiting for the writer thread",
+         [({}, current["queued"])]),
+    ]
+
+
+register_collector(_collect_metrics)
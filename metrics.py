@@ -0,0 +1,208 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from flask import Response, g, request
+
+# Latency buckets in seconds, from fast cache hits to slow LLM generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Endpoint the current request is serving; work outside a request is "background"
+current_endpoint = contextvars.ContextVar("current_endpoint", default="background")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}"
+                )
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+
+def register_collector(collect):
+    """Add a callable returning (name, type, help, [(labels_dict, value), ...]) tuples"""
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+request_duration = _register(Histogram(
+    "mixmaster_request_duration_seconds", "HTTP request latency until the response is returned",
+    ("endpoint", "method", "status"),
+))
+stage_duration = _register(Histogram(
+    "mixmaster_stage_duration_seconds", "Time spent in each request stage",
+    ("endpoint", "stage"),
+))
+llm_tokens = _register(Counter(
+    "mixmaster_llm_tokens_total", "Tokens reported by OpenAI in response.usage",
+    ("endpoint", "model", "kind"),
+))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current endpoint"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - started, endpoint=current_endpoint.get(), stage=name)
+
+
+def in_current_context(iterable):
+    """Iterate ``iterable`` in a copy of the current context.
+
+    Streamed response bodies are consumed after the view returns, so without
+    this their stages would no longer be tagged with the request's endpoint.
+    """
+    context = contextvars.copy_context()
+    iterator = iter(iterable)
+
+    def run():
+        while True:
+            try:
+                yield context.run(next, iterator)
+            except StopIteration:
+                return
+
+    return run()
+
+
+def record_usage(model, usage):
+    """Count prompt/completion tokens from an OpenAI ``usage`` object"""
+    if usage is None:
+        return
+    endpoint = current_endpoint.get()
+    for kind in ("prompt", "completion"):
+        count = getattr(usage, f"{kind}_tokens", None)
+        if isinstance(count, int):
+            llm_tokens.inc(count, endpoint=endpoint, model=model or "", kind=kind)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        for name, kind, documentation, samples in collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def instrument(app):
+    """Time every request of a Flask app, tag its stages and serve /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_token = current_endpoint.set(request.url_rule.rule if request.url_rule else "unmatched")
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            request_duration.observe(
+                time.perf_counter() - started,
+                endpoint=current_endpoint.get(),
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
+
+    @app.teardown_request
+    def _reset_endpoint(exc=None):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            try:
+                current_endpoint.reset(token)
+            except ValueError:
+                # Streamed responses may finish on a different thread than they started
+                pass
+
+    @app.route("/metrics", endpoint="metrics")
+    def _metrics_route():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,173 @@
+import logging
+
+# Named lock held while migrations run so concurrent workers don't race
+MIGRATION_LOCK = "mix_master_schema_migrations"
+
+# Statements that recompute the rollups from chat_messages
+REBUILD_ROLLUPS_SQL = [
+    """
+    INSERT INTO sessions (session_id, message_count, user_messages, assistant_messages)
+    SELECT session_id, COUNT(*), SUM(message_type = 'user'), SUM(message_type = 'assistant')
+    FROM chat_messages
+    GROUP BY session_id
+    ON DUPLICATE KEY UPDATE
+    message_count = VALUES(message_count),
+    user_messages = VALUES(user_messages),
+    assistant_messages = VALUES(assistant_messages)
+    """,
+    "DELETE FROM analytics_counters",
+    """
+    INSERT INTO analytics_counters (name, slot, value)
+    SELECT 'total_sessions', 0, COUNT(*) FROM sessions
+    UNION ALL
+    SELECT 'total_messages', 0, COALESCE(SUM(message_count), 0) FROM sessions
+    UNION ALL
+    SELECT 'messages_user', 0, COALESCE(SUM(user_messages), 0) FROM sessions
+    UNION ALL
+    SELECT 'messages_assistant', 0, COALESCE(SUM(assistant_messages), 0) FROM sessions
+    """,
+]
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+# --- Migrations ---
+# Each one must tolerate a schema that already has some of its changes, since
+# tables created by older builds were recreated on every boot.
+
+def _baseline_schema(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `sessions` (
+            `id` int(11) NOT NULL AUTO_INCREMENT,
+            `session_id` varchar(255) NOT NULL,
+            `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            `last_activity` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            `message_count` int(11) DEFAULT 0,
+            PRIMARY KEY (`id`),
+            UNIQUE KEY `unique_session_id` (`session_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `chat_messages` (
+            `id` int(11) NOT NULL AUTO_INCREMENT,
+            `session_id` varchar(255) NOT NULL,
+            `message_type` enum('user','assistant') NOT NULL,
+            `content` text NOT NULL,
+            `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (`id`),
+            KEY `idx_session_id` (`session_id`),
+            KEY `idx_timestamp` (`timestamp`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def _history_tail_index(cursor):
+    if not _index_exists(cursor, "chat_messages", "idx_session_id_id"):
+        cursor.execute("ALTER TABLE `chat_messages` ADD KEY `idx_session_id_id` (`session_id`, `id`)")
+    if _index_exists(cursor, "chat_messages", "idx_session_id"):
+        # Redundant prefix of the composite index
+        cursor.execute("ALTER TABLE `chat_messages` DROP KEY `idx_session_id`")
+
+
+def _analytics_rollups(cursor):
+    for column in ("user_messages", "assistant_messages"):
+        if not _column_exists(cursor, "sessions", column):
+            cursor.execute(
+                f"ALTER TABLE `sessions` ADD COLUMN `{column}` int(11) NOT NULL DEFAULT 0"
+            )
+    if not _index_exists(cursor, "sessions", "idx_last_activity"):
+        cursor.execute("ALTER TABLE `sessions` ADD KEY `idx_last_activity` (`last_activity`)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `analytics_counters` (
+            `name` varchar(64) NOT NULL,
+            `slot` tinyint(3) unsigned NOT NULL,
+            `value` bigint(20) NOT NULL DEFAULT 0,
+            PRIMARY KEY (`name`, `slot`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    for statement in REBUILD_ROLLUPS_SQL:
+        cursor.execute(statement)
+
+
+def _session_summaries(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `session_summaries` (
+            `session_id` varchar(255) NOT NULL,
+            `summary` text NOT NULL,
+            `last_message_id` int(11) NOT NULL,
+            `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`session_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+MIGRATIONS = [
+    (1, "baseline chat schema", _baseline_schema),
+    (2, "(session_id, id) index for tail-window history", _history_tail_index),
+    (3, "analytics rollup counters", _analytics_rollups),
+    (4, "rolling conversation summaries", _session_summaries),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    """Return the applied schema version, or 0 if none is recorded"""
+    cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+    row = cursor.fetchone()
+    return (row["version"] if row else None) or 0
+
+
+def apply_pending(cursor, database, lock_timeout=60):
+    """Create the database if needed and apply pending migrations under a lock.
+
+    ``cursor`` must belong to a server connection that is not bound to a
+    database. Returns the schema version after migrating.
+    """
+    cursor.execute(
+        f"CREATE DATABASE IF NOT EXISTS `{database}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+    )
+    cursor.execute(f"USE `{database}`")
+
+    cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", (MIGRATION_LOCK, lock_timeout))
+    if not cursor.fetchone()["acquired"]:
+        raise RuntimeError(f"Timed out after {lock_timeout}s waiting for the migration lock")
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS `schema_version` (
+                `version` int(11) NOT NULL,
+                `description` varchar(255) NOT NULL,
+                `applied_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (`version`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        # Re-read under the lock: another worker may have just migrated
+        version = current_version(cursor)
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            logging.info(f"Applying schema migration {number}: {description}")
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (number, description)
+            )
+            version = number
+        return version
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
@@ -0,0 +1,86 @@
+import re
+import unicodedata
+
+# Common alternative spellings mapped to one canonical location name
+LOCATION_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "ny": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "san fran": "san francisco",
+    "dc": "washington dc",
+    "washington d c": "washington dc",
+    "us": "united states",
+    "usa": "united states",
+    "united states of america": "united states",
+    "america": "united states",
+    "uk": "united kingdom",
+    "great britain": "united kingdom",
+    "britain": "united kingdom",
+    "uae": "united arab emirates",
+    "bombay": "mumbai",
+    "peking": "beijing",
+    "saigon": "ho chi minh city",
+    "deutschland": "germany",
+    "espana": "spain",
+    "nippon": "japan",
+    "rio": "rio de janeiro",
+    "cdmx": "mexico city",
+}
+
+
+def canonical_text(value):
+    """Case-fold, strip accents and punctuation, and collapse whitespace"""
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s,]", " ", text.casefold())
+    return " ".join(text.split())
+
+
+def canonicalize_location(location):
+    """Map free-text locations like " Tokyo ", "tokyo" or "NYC" to one key"""
+    parts = [LOCATION_ALIASES.get(part.strip(), part.strip()) for part in canonical_text(location).split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+# Buckets are tried in order, so more specific conditions come first
+MOOD_BUCKETS = [
+    ("celebratory", {"celebrate", "celebrating", "celebratory", "festive", "party", "partying", "excited", "ecstatic"}),
+    ("romantic", {"romantic", "love", "loving", "date", "flirty", "passionate"}),
+    ("sad", {"sad", "down", "blue", "depressed", "lonely", "heartbroken", "gloomy", "melancholy", "upset"}),
+    ("stressed", {"stressed", "anxious", "tense", "nervous", "overwhelmed", "angry", "frustrated", "tired", "exhausted"}),
+    ("relaxed", {"relaxed", "chill", "calm", "mellow", "peaceful", "lazy", "cozy", "content"}),
+    ("adventurous", {"adventurous", "curious", "bold", "wild", "daring", "experimental"}),
+    ("happy", {"happy", "good", "great", "joyful", "cheerful", "upbeat", "fun", "energetic", "playful"}),
+]
+
+WEATHER_BUCKETS = [
+    ("stormy", {"storm", "stormy", "thunder", "thunderstorm", "lightning", "hurricane", "typhoon"}),
+    ("snowy", {"snow", "snowy", "snowing", "blizzard", "sleet", "icy", "freezing"}),
+    ("rainy", {"rain", "rainy", "raining", "drizzle", "shower", "showers", "wet", "monsoon"}),
+    ("hot", {"hot", "heat", "scorching", "sweltering", "humid", "tropical", "boiling"}),
+    ("cold", {"cold", "chilly", "cool", "frosty", "wintry", "winter", "brisk"}),
+    ("sunny", {"sunny", "sun", "clear", "bright", "warm", "summer", "fine"}),
+    ("cloudy", {"cloudy", "overcast", "grey", "gray", "foggy", "fog", "misty", "windy"}),
+]
+
+
+def _bucket(value, buckets):
+    text = canonical_text(value)
+    words = set(text.replace(",", " ").split())
+    for name, keywords in buckets:
+        if words & keywords:
+            return name
+    # Unrecognized values still share a key once case and spacing are normalized
+    return text
+
+
+def canonicalize_mood(mood):
+    """Map free-text moods like "Happy!" or "feeling great" to a bucket"""
+    return _bucket(mood, MOOD_BUCKETS)
+
+
+def canonicalize_weather(weather):
+    """Map free-text weather like "Sunny " or "hot and sunny" to a bucket"""
+    return _bucket(weather, WEATHER_BUCKETS)
@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from clients import http_session
+
+load_dotenv()
+
+READINESS_INTERVAL = float(os.getenv("READINESS_INTERVAL", "30"))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "5"))
+# Optional comma-separated subset of openai,serper,database to limit every
+# app's checks to; each app otherwise probes the upstreams it uses
+READINESS_CHECKS = [
+    name.strip() for name in os.getenv("READINESS_CHECKS", "").split(",")
+    if name.strip()
+]
+
+
+class ReadinessProber:
+    """Checks upstream dependencies on a background thread and caches the results.
+
+    ``status`` only reads the cache, so readiness endpoints never do I/O.
+    A check is a callable that raises if its upstream is unavailable.
+    """
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self._checks = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register(self, name, check):
+        with self._lock:
+            self._checks[name] = check
+            self._results[name] = {"status": "pending", "checked_at": None}
+
+    def start(self):
+        """Start probing; safe to call repeatedly (also restarts after a fork)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="readiness-prober", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def probe(self):
+        """Run every check once and record the results"""
+        with self._lock:
+            checks = list(self._checks.items())
+        for name, check in checks:
+            started = time.monotonic()
+            try:
+                check()
+                result = {"status": "ok"}
+            except Exception as e:
+                result = {"status": "error", "error": str(e)}
+                logging.warning(f"Readiness check '{name}' failed: {str(e)}")
+            result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+            result["checked_at"] = time.time()
+            with self._lock:
+                self._results[name] = result
+
+    def status(self):
+        self.start()
+        with self._lock:
+            checks = {name: dict(result) for name, result in self._results.items()}
+        return {
+            "ready": all(result["status"] == "ok" for result in checks.values()),
+            "checks": checks,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+
+# --- Checks ---
+
+def check_openai(client, timeout=READINESS_TIMEOUT):
+    client.with_options(timeout=timeout, max_retries=0).models.list()
+
+
+def check_serper(timeout=READINESS_TIMEOUT):
+    # Any HTTP response proves the host is reachable; queries are billed, so none is sent
+    from search_cache import SERPER_API_KEY, SERPER_BASE_URL
+    if not SERPER_API_KEY:
+        raise RuntimeError("SERPER_API_KEY is not set")
+    http_session.head(SERPER_BASE_URL, timeout=timeout)
+
+
+def check_database():
+    # Imported here so apps without a database don't connect at import time
+    from database import db_manager
+    with db_manager.connection() as conn:
+        conn.ping(reconnect=False)
+
+
+def create_prober(openai_client=None, checks=("openai",), interval=None):
+    """Build and start a prober for the named upstreams (those the app depends on)"""
+    prober = ReadinessProber(interval=READINESS_INTERVAL if interval is None else interval)
+    for name in checks:
+        if READINESS_CHECKS and name not in READINESS_CHECKS:
+            continue
+        if name == "openai":
+            prober.register("openai", lambda: check_openai(openai_client))
+        elif name == "serper":
+            prober.register("serper", check_serper)
+        elif name == "database":
+            prober.register("database", check_database)
+        else:
+            raise ValueError(f"Unknown readiness check: {name}")
+    prober.start()
+    return prober
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from cache_store import CACHE_DIR, make_cache
+
+load_dotenv()
+
+# Items generated at once across all jobs
+RECIPE_JOB_WORKERS = int(os.getenv("RECIPE_JOB_WORKERS", "4"))
+RECIPE_JOB_MAX_ITEMS = int(os.getenv("RECIPE_JOB_MAX_ITEMS", "500"))
+# Request body limit for job submissions, which carry every item's image
+RECIPE_JOB_MAX_UPLOAD_BYTES = int(os.getenv("RECIPE_JOB_MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+# Finished jobs are deleted after this many seconds
+RECIPE_JOB_RETENTION = int(os.getenv("RECIPE_JOB_RETENTION", "604800"))
+RECIPE_JOB_DB = os.getenv("RECIPE_JOB_DB", os.path.join(CACHE_DIR, "recipe_jobs.sqlite3"))
+
+# Completed items by spec + image, so a resubmitted batch skips them
+RECIPE_ITEM_CACHE_TTL = int(os.getenv("RECIPE_ITEM_CACHE_TTL", "2592000"))
+recipe_item_cache = make_cache(
+    "recipe_items",
+    max_entries=int(os.getenv("RECIPE_ITEM_CACHE_MAX_ENTRIES", "20000")),
+    backend=os.getenv("RECIPE_ITEM_CACHE_BACKEND", "sqlite"),
+)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+
+def item_key(fields, image_bytes):
+    """Identify a recipe spec by its form fields and the exact uploaded image"""
+    digest = hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8"))
+    digest.update(hashlib.sha256(image_bytes).digest())
+    return digest.hexdigest()
+
+
+class RecipeJobs:
+    """Batch recipe generation with job state kept in SQLite.
+
+    Each job holds many items; an item is one form (the fields
+    ``/generate_recipe`` reads) plus its image. Items run on a shared pool of
+    ``workers`` threads through ``process(fields, image_bytes)``. Images are
+    kept in the database until their item finishes, so unfinished jobs are
+    picked up again by ``resume()`` after a restart.
+    """
+
+    def __init__(self, path, process, cache=None, cache_ttl=None, workers=4):
+        self.path = path
+        self.process = process
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recipe-job")
+        self._local = threading.local()
+        # Signalled whenever an item finishes, for result streams waiting on it
+        self._changed = threading.Condition()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                item_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                image BLOB,
+                status TEXT NOT NULL,
+                recipe TEXT,
+                error TEXT,
+                cached INTEGER NOT NULL DEFAULT 0,
+                finished_at REAL,
+                PRIMARY KEY (job_id, idx)
+            )
+        """)
+
+    def _connection(self):
+        # One connection per thread; WAL lets pollers read while workers write
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def submit(self, items):
+        """Create a job from ``[(fields, image_bytes), ...]``; returns its status"""
+        self.purge()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for idx, (fields, image_bytes) in enumerate(items):
+            key = item_key(fields, image_bytes)
+            recipe = self._cached(key)
+            if recipe is not None:
+                rows.append((job_id, idx, key, fields.get("name", ""), json.dumps(fields), None,
+                             DONE, recipe, 1, now))
+            else:
+                rows.append((job_id, idx, key, fields.get("name", ""), json.dumps(fields), image_bytes,
+                             PENDING, None, 0, None))
+
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT INTO jobs (job_id, total, created_at) VALUES (?, ?, ?)",
+                (job_id, len(rows), now),
+            )
+            conn.executemany("""
+                INSERT INTO job_items
+                (job_id, idx, item_key, name, fields, image, status, recipe, cached, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        pending = [row[1] for row in rows if row[6] == PENDING]
+        for idx in pending:
+            self.pool.submit(self._run_item, job_id, idx)
+        if not pending:
+            self._finish_job(job_id)
+        logging.info(f"Recipe job {job_id}: {len(rows)} items, {len(rows) - len(pending)} from cache")
+        return self.status(job_id)
+
+    def resume(self):
+        """Queue the unfinished items of every job (e.g. after a restart)"""
+        conn = self._connection()
+        conn.execute("UPDATE job_items SET status = ? WHERE status = ?", (PENDING, RUNNING))
+        rows = conn.execute(
+            "SELECT job_id, idx FROM job_items WHERE status = ? ORDER BY job_id, idx", (PENDING,)
+        ).fetchall()
+        for row in rows:
+            self.pool.submit(self._run_item, row["job_id"], row["idx"])
+        if rows:
+            logging.info(f"Resumed {len(rows)} pending recipe job items")
+        return len(rows)
+
+    def _run_item(self, job_id, idx):
+        conn = self._connection()
+        claimed = conn.execute(
+            "UPDATE job_items SET status = ? WHERE job_id = ? AND idx = ? AND status = ?",
+            (RUNNING, job_id, idx, PENDING),
+        ).rowcount
+        if not claimed:
+            return
+        row = conn.execute(
+            "SELECT item_key, fields, image FROM job_items WHERE job_id = ? AND idx = ?", (job_id, idx)
+        ).fetchone()
+        recipe, error, cached = None, None, 0
+        try:
+            # An identical item may have finished since the job was submitted
+            recipe = self._cached(row["item_key"])
+            if recipe is not None:
+                cached = 1
+            else:
+                recipe = self.process(json.loads(row["fields"]), row["image"])
+                if recipe and self.cache is not None:
+                    self.cache.set(row["item_key"], recipe)
+        except Exception as e:
+            logging.error(f"Recipe job {job_id} item {idx} failed: {str(e)}")
+            error = str(e) or type(e).__name__
+
+        conn.execute("""
+            UPDATE job_items SET status = ?, recipe = ?, error = ?, cached = ?, image = NULL, finished_at = ?
+            WHERE job_id = ? AND idx = ?
+        """, (FAILED if error else DONE, recipe, error, cached, time.time(), job_id, idx))
+        self._finish_job(job_id)
+        with self._changed:
+            self._changed.notify_all()
+
+    def _cached(self, key):
+        if self.cache is None:
+            return None
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        recipe, stored_at = entry
+        if self.cache_ttl is not None and time.time() - stored_at >= self.cache_ttl:
+            return None
+        return recipe
+
+    def _finish_job(self, job_id):
+        # Stamp the job once no item is left to run
+        self._connection().execute("""
+            UPDATE jobs SET finished_at = ?
+            WHERE job_id = ? AND finished_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM job_items WHERE job_id = ? AND status IN (?, ?)
+            )
+        """, (time.time(), job_id, job_id, PENDING, RUNNING))
+
+    def status(self, job_id):
+        """Progress counts for a job, or None if it doesn't exist"""
+        conn = self._connection()
+        job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        cached = 0
+        for row in conn.execute("""
+            SELECT status, COUNT(*) AS n, SUM(cached) AS cached FROM job_items
+            WHERE job_id = ? GROUP BY status
+        """, (job_id,)):
+            counts[row["status"]] = row["n"]
+            cached += row["cached"] or 0
+        finished = counts[DONE] + counts[FAILED]
+        return {
+            "job_id": job_id,
+            "status": "completed" if job["finished_at"] else ("running" if finished or counts[RUNNING] else "queued"),
+            "total": job["total"],
+            "completed": counts[DONE],
+            "failed": counts[FAILED],
+            "pending": counts[PENDING] + counts[RUNNING],
+            "cached": cached,
+            "progress": round(finished / job["total"], 3) if job["total"] else 1.0,
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+        }
+
+    def results(self, job_id, follow=True, poll_interval=1.0):
+        """Yield finished items as dicts; with ``follow``, wait until the job completes"""
+        conn = self._connection()
+        sent = set()
+        while True:
+            job = conn.execute("SELECT finished_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            # A job purged (or never created) has nothing more to send
+            done = job is None or job["finished_at"] is not None
+            rows = conn.execute("""
+                SELECT idx, name, status, recipe, error, cached FROM job_items
+                WHERE job_id = ? AND status IN (?, ?) ORDER BY finished_at, idx
+            """, (job_id, DONE, FAILED)).fetchall()
+            for row in rows:
+                if row["idx"] in sent:
+                    continue
+                sent.add(row["idx"])
+                item = {"index": row["idx"], "name": row["name"], "status": row["status"],
+                        "cached": bool(row["cached"])}
+                if row["status"] == DONE:
+                    item["recipe"] = row["recipe"]
+                else:
+                    item["error"] = row["error"]
+                yield item
+            if done or not follow:
+                return
+            with self._changed:
+                self._changed.wait(poll_interval)
+
+    def purge(self):
+        """Delete jobs that finished more than RECIPE_JOB_RETENTION seconds ago"""
+        cutoff = time.time() - RECIPE_JOB_RETENTION
+        conn = self._connection()
+        conn.execute("""
+            DELETE FROM job_items WHERE job_id IN (
+                SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?
+            )
+        """, (cutoff,))
+        conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+
+def create_recipe_jobs(process):
+    """Job runner with the configured database, item cache and worker count"""
+    return RecipeJobs(
+        RECIPE_JOB_DB,
+        process,
+        cache=recipe_item_cache,
+        cache_ttl=RECIPE_ITEM_CACHE_TTL,
+        workers=RECIPE_JOB_WORKERS,
+    )
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+from cache_store import make_cache
+from clients import http_session
+from singleflight import group
+from metrics import stage
+
+load_dotenv()
+
+SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+SERPER_BASE_URL = os.getenv("SERPER_BASE_URL", "https://google.serper.dev").rstrip("/")
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "5"))
+
+
+class SearchCacheMiss(Exception):
+    """Raised in offline mode when a search has no cached result"""
+
+
+class SearchCache:
+    """Serper result cache keyed by (endpoint, query, params).
+
+    Each entry carries its own TTL. In offline mode no requests are made:
+    cached results are served whatever their age, and anything else raises
+    SearchCacheMiss. If a live request fails, an expired entry is served
+    rather than nothing.
+    """
+
+    def __init__(self, store, ttl=604800, offline=False):
+        self.store = store
+        self.ttl = ttl
+        self.offline = offline
+        self._stats = {"hits": 0, "misses": 0, "stale_served": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._flight = group("serper")
+
+    @staticmethod
+    def key(endpoint, query, params=None):
+        # Search engines ignore case and spacing, so the key does too
+        query = " ".join(str(query).split()).casefold()
+        digest = hashlib.sha256(
+            json.dumps([query, params or {}], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return f"{endpoint}:{digest}"
+
+    def search(self, endpoint, query, params=None, ttl=None, timeout=None):
+        """POST a query to a Serper endpoint ("search", "images", ...), cached"""
+        key = self.key(endpoint, query, params)
+        entry = self.store.get(key)
+        if entry is not None:
+            cached, stored_at = entry
+            if self.offline or time.time() - stored_at < cached["ttl"]:
+                self._count("hits")
+                return cached["data"]
+
+        if self.offline:
+            self._count("misses")
+            raise SearchCacheMiss(f"No cached Serper {endpoint} result for {query!r}")
+
+        self._count("misses")
+        try:
+            # Identical lookups already in flight share one request
+            data = self._flight.do(key, self._fetch, key, endpoint, query, params, ttl, timeout)
+        except Exception:
+            self._count("errors")
+            if entry is not None:
+                self._count("stale_served")
+                logging.warning(f"Serper {endpoint} request failed, serving a stale result")
+                return entry[0]["data"]
+            raise
+        return data
+
+    def _fetch(self, key, endpoint, query, params, ttl, timeout):
+        with stage("serper"):
+            response = http_session.post(
+                f"{SERPER_BASE_URL}/{endpoint}",
+                headers={"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"},
+                json={"q": query, **(params or {})},
+                timeout=SERPER_TIMEOUT if timeout is None else timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+        self.store.set(key, {"ttl": self.ttl if ttl is None else ttl, "data": data})
+        return data
+
+    def invalidate(self, endpoint=None):
+        """Drop cached results for one endpoint, or all of them"""
+        if endpoint is None:
+            self.store.clear()
+        else:
+            self.store.delete_prefix(f"{endpoint}:")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["coalesced"] = self._flight.stats()["coalesced"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = len(self.store)
+        stats["offline"] = self.offline
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# Shared cache for all Serper lookups; on disk by default so it survives restarts
+search_cache = SearchCache(
+    make_cache(
+        "serper",
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "20000")),
+        backend=os.getenv("SEARCH_CACHE_BACKEND", "sqlite"),
+    ),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "604800")),
+    offline=os.getenv("SEARCH_CACHE_OFFLINE", "false").lower() in ("1", "true", "yes"),
+)
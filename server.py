@@ -0,0 +1,74 @@
+"""Serve every endpoint module from a single process.
+
+Each module keeps its own Flask app, so paths, response shapes, CORS and
+config are unchanged. Requests are routed to the first app whose URL map
+matches. The combined WSGI app runs under uvicorn through a2wsgi, which
+runs handlers on a large thread pool. LLM calls spend their time waiting
+on the network, so a single process can hold hundreds of them in flight.
+
+    python server.py
+    uvicorn server:asgi_app --host 0.0.0.0 --port 8000
+"""
+import os
+import logging
+from a2wsgi import WSGIMiddleware
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import RequestRedirect
+from dotenv import load_dotenv
+
+import chatbot
+import explores
+import full_cocktail
+import half_cocktail
+import drink_recommendation
+
+load_dotenv()
+
+# Concurrent requests in flight; each one occupies a thread while it waits upstream
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "256"))
+
+
+class PathDispatcher:
+    """WSGI app that sends each request to the first app with a matching route"""
+
+    def __init__(self, apps):
+        self.apps = apps
+
+    def __call__(self, environ, start_response):
+        return self.resolve(environ)(environ, start_response)
+
+    def resolve(self, environ):
+        fallback = None
+        for app in self.apps:
+            adapter = app.url_map.bind_to_environ(environ)
+            try:
+                adapter.match()
+                return app
+            except RequestRedirect:
+                return app
+            except MethodNotAllowed:
+                # Path exists here for another method; keep looking for a full match
+                fallback = fallback or app
+            except NotFound:
+                continue
+        return fallback or self.apps[0]
+
+
+# Earlier apps win when paths overlap (e.g. /ready and /static)
+wsgi_app = PathDispatcher([
+    chatbot.app,
+    explores.app,
+    full_cocktail.app,
+    half_cocktail.app,
+    drink_recommendation.app,
+])
+asgi_app = WSGIMiddleware(wsgi_app, workers=SERVER_THREADS)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    host = os.getenv("SERVER_HOST", "0.0.0.0")
+    port = int(os.getenv("SERVER_PORT", "8000"))
+    logging.info(f"Serving all endpoints on {host}:{port} with {SERVER_THREADS} threads")
+    uvicorn.run(asgi_app, host=host, port=port)
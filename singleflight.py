@@ -0,0 +1,100 @@
+import threading
+from metrics import register_collector
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function. Callers that arrive while
+    it is in flight wait and receive the same result, or the same exception.
+    Nothing is kept once the call finishes; pair it with a cache for reuse.
+    Results are shared between callers, so they must not be mutated.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            total = self._executed + self._coalesced
+            return {
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._calls),
+                "coalesce_rate": round(self._coalesced / total, 3) if total else 0.0,
+            }
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def group(name):
+    """Return the process-wide SingleFlight registered under ``name``"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def stats():
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {flight.name: flight.stats() for flight in groups}
+
+
+def _collect_metrics():
+    flights = stats()
+    return [
+        ("mixmaster_singleflight_calls_total", "counter", "Upstream calls by single-flight group and outcome",
+         [({"group": name, "outcome": outcome}, counts[outcome])
+          for name, counts in flights.items() for outcome in ("executed", "coalesced")]),
+        ("mixmaster_singleflight_in_flight", "gauge", "Calls currently running per single-flight group",
+         [({"group": name}, counts["in_flight"]) for name, counts in flights.items()]),
+    ]
+
+
+register_collector(_collect_metrics)
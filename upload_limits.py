@@ -0,0 +1,38 @@
+import os
+from flask import jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Largest request body accepted; base64 JSON images are about 4/3 of the file size
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(16 * 1024 * 1024)))
+
+
+def limit_uploads(app, max_bytes=None, overrides=None):
+    """Cap request bodies of a Flask app and answer oversized ones with a JSON 413.
+
+    ``overrides`` maps URL rules to their own limit. Requests whose
+    Content-Length is over the limit are rejected before any of the body is
+    read; bodies without one are cut off by Werkzeug once they pass it.
+    """
+    app.config["MAX_CONTENT_LENGTH"] = max_bytes or MAX_UPLOAD_BYTES
+    overrides = overrides or {}
+
+    @app.before_request
+    def _reject_oversized():
+        rule = request.url_rule.rule if request.url_rule else None
+        if rule in overrides:
+            request.max_content_length = overrides[rule]
+        length = request.content_length
+        if length is not None and length > request.max_content_length:
+            raise RequestEntityTooLarge()
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def _too_large(e):
+        return jsonify({
+            "success": False,
+            "error": f"Request body is larger than the {request.max_content_length} byte limit.",
+        }), 413
+
+    return app
@@ -0,0 +1,143 @@
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+
+class MessageWriter:
+    """Write-behind queue that persists chat messages from a background thread.
+
+    Messages are buffered in memory and handed to ``write_batch`` in FIFO order,
+    either once ``batch_size`` messages are waiting or once the oldest one has
+    waited ``flush_interval`` seconds. ``write_batch`` receives a list of
+    ``(session_id, message_type, content)`` tuples.
+    """
+
+    def __init__(self, write_batch, flush_interval=0.5, batch_size=100,
+                 max_queue=10000, max_retries=3):
+        self._write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+
+        self._buffer = deque()  # (enqueued_at, session_id, message_type, content)
+        self._pending = Counter()
+        self._submitted = 0
+        self._written = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"batches": 0, "messages": 0, "dropped": 0, "rejected": 0}
+
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id, message_type, content):
+        """Queue a message; returns False if the queue is full or closed"""
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_queue:
+                self._stats["rejected"] += 1
+                return False
+            self._buffer.append((time.monotonic(), session_id, message_type, content))
+            self._pending[session_id] += 1
+            self._submitted += 1
+            # Wake the flusher to start the interval timer or write a full batch
+            if len(self._buffer) == 1 or len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def has_pending(self, session_id=None):
+        """Whether messages (optionally for one session) are still queued"""
+        with self._cond:
+            if session_id is None:
+                return self._written < self._submitted
+            return self._pending[session_id] > 0
+
+    def flush(self, timeout=None):
+        """Block until every message submitted so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            if self._written >= target:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._written < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the background thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error(f"Message writer did not drain within {timeout}s; {self.queue_depth()} messages lost")
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def stats(self):
+        """Return write-behind queue metrics"""
+        with self._cond:
+            return dict(self._stats, queued=len(self._buffer))
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._buffer and not self._closed:
+                self._cond.wait()
+            if not self._buffer:
+                return None
+            while (
+                len(self._buffer) < self.batch_size
+                and not self._flush_requested
+                and not self._closed
+            ):
+                remaining = self._buffer[0][0] + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.batch_size, len(self._buffer))
+            batch = [self._buffer.popleft()[1:] for _ in range(count)]
+            if not self._buffer:
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            written = self._write_with_retries(batch)
+            with self._cond:
+                for session_id, _, _ in batch:
+                    self._pending[session_id] -= 1
+                    if self._pending[session_id] <= 0:
+                        del self._pending[session_id]
+                self._written += len(batch)
+                self._stats["batches"] += 1
+                if written:
+                    self._stats["messages"] += len(batch)
+                else:
+                    self._stats["dropped"] += len(batch)
+                self._cond.notify_all()
+
+    def _write_with_retries(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write_batch(batch)
+                return True
+            except Exception as e:
+                logging.warning(f"Batched message write failed (attempt {attempt + 1}): {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        logging.error(f"Dropping {len(batch)} chat messages after {self.max_retries + 1} failed writes")
+        return False